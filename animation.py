@@ -0,0 +1,186 @@
+import math
+import os
+from typing import BinaryIO, List, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from qrcode.constants import ERROR_CORRECT_H
+
+from generator import apply_style, build_qr_matrix, draw_modules, hex_to_rgb, place_logo
+
+# Поддерживаемые анимации
+ANIMATIONS = ("gradient", "pulse")
+
+
+def build_module_mask(qr_matrix, size: int, border: int, corner_style: str, dot_style: str,
+                      skip_modules: set = None) -> Image.Image:
+    """Рисует форму модулей один раз в маску (L, 255 - модуль)"""
+    matrix_size = len(qr_matrix)
+    img_size = matrix_size * size + 2 * border * size
+    mask = Image.new("L", (img_size, img_size), 0)
+    draw_modules(ImageDraw.Draw(mask), qr_matrix, size, border, 255, None,
+                 corner_style, dot_style, skip_modules=skip_modules)
+    return mask
+
+
+def render_qr_animation(
+        qr_matrix,
+        animation: str = "gradient",
+        frames: int = 12,
+        logo=None,
+        color: str = "#000000",
+        bg_color: str = "#FFFFFF",
+        size: int = 10,
+        border: int = 4,
+        style: str = "default",
+        gradient: Tuple[str, str] = None,
+        corner_style: str = "square",
+        dot_style: str = "square"
+) -> List[Image.Image]:
+    """
+    Рендерит кадры анимированного QR-кода
+
+    Форма модулей рисуется один раз, в кадрах меняется только цветовое поле
+    ("gradient" - бегущий градиент) или сила свечения ("pulse" - неоновая пульсация).
+    Паттерны и эффекты стилей в анимации не применяются.
+
+    :param qr_matrix: Матрица модулей из build_qr_matrix
+    :param animation: Вид анимации из ANIMATIONS
+    :param frames: Число кадров (анимация зацикливается без скачка)
+    :param logo: Путь к логотипу или уже загруженное изображение
+    :return: Список кадров RGB
+    """
+    if animation not in ANIMATIONS:
+        raise ValueError(f"Неизвестная анимация {animation}, доступны: {', '.join(ANIMATIONS)}")
+    if frames < 1:
+        raise ValueError(f"Число кадров должно быть не меньше 1: {frames}")
+
+    color, bg_color, gradient, _, corner_style, dot_style = apply_style(
+        style, color, bg_color, gradient, None, corner_style, dot_style
+    )
+    start_rgb, end_rgb = (hex_to_rgb(c) for c in (gradient or (color, color)))
+    if animation == "gradient" and start_rgb == end_rgb:
+        # Все кадры вышли бы одинаковыми, и GIF схлопнулся бы в один кадр
+        raise ValueError("Для анимации gradient нужен градиент из двух разных цветов: "
+                         "укажите --gradient или стиль с градиентом")
+
+    placement = place_logo(logo, qr_matrix, size, border) if logo is not None else None
+    mask = build_module_mask(qr_matrix, size, border, corner_style, dot_style,
+                             placement[2] if placement else None)
+    background = Image.new("RGB", mask.size, bg_color)
+    img_size = mask.size[0]
+
+    def finish(frame: Image.Image) -> Image.Image:
+        if placement:
+            prepared_logo, pos, _ = placement
+            frame.paste(prepared_logo, pos, prepared_logo)
+        return frame
+
+    result = []
+    if animation == "gradient":
+        # Диагональная координата 0..1, как у статического градиента
+        coords = np.arange(img_size, dtype=np.float32) / (img_size * 2)
+        diagonal = coords[:, None] + coords[None, :]
+        start = np.array(start_rgb, dtype=np.float32)
+        delta = np.array(end_rgb, dtype=np.float32) - start
+
+        for index in range(frames):
+            # Треугольная волна, чтобы последний кадр плавно переходил в первый
+            phase = (diagonal + index / frames) % 1.0
+            ratio = 1.0 - np.abs(2.0 * phase - 1.0)
+            field = (start + delta * ratio[..., None]).astype(np.uint8)
+            result.append(finish(Image.composite(Image.fromarray(field, "RGB"), background, mask)))
+    else:
+        base = Image.composite(Image.new("RGB", mask.size, color), background, mask)
+        glow_mask = mask.filter(ImageFilter.GaussianBlur(radius=max(2, size // 3)))
+        glow = Image.composite(Image.new("RGB", mask.size, end_rgb), background, glow_mask)
+
+        for index in range(frames):
+            strength = 0.35 + 0.35 * math.sin(2 * math.pi * index / frames)
+            result.append(finish(Image.blend(base, glow, strength)))
+
+    return result
+
+
+def save_animation(frames: List[Image.Image], fp: Union[str, BinaryIO], fmt: str = "GIF",
+                   duration: int = 80) -> None:
+    """
+    Сохраняет кадры в GIF или APNG с общей палитрой
+
+    Палитра строится один раз по всем кадрам; PIL сам записывает
+    в каждый кадр только область, изменившуюся относительно предыдущего.
+
+    :param frames: Кадры RGB
+    :param fp: Путь или файл для записи
+    :param fmt: "GIF" или "PNG" (APNG)
+    :param duration: Длительность кадра в миллисекундах
+    """
+    # Общая палитра по уменьшенным копиям всех кадров
+    thumb_width = min(frames[0].width, 128)
+    thumb_height = max(1, frames[0].height * thumb_width // frames[0].width)
+    strip = Image.new("RGB", (thumb_width, thumb_height * len(frames)))
+    for index, frame in enumerate(frames):
+        strip.paste(frame.resize((thumb_width, thumb_height), Image.NEAREST), (0, index * thumb_height))
+    palette = strip.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+    indexed = [frame.quantize(palette=palette, dither=Image.Dither.NONE) for frame in frames]
+    indexed[0].save(
+        fp,
+        format=fmt,
+        save_all=True,
+        append_images=indexed[1:],
+        duration=duration,
+        loop=0,
+        optimize=False,
+    )
+
+
+def generate_qr_animation(
+        text: str,
+        output_path: str = "output.gif",
+        animation: str = "gradient",
+        frames: int = 12,
+        duration: int = 80,
+        logo_path: str = None,
+        color: str = "#000000",
+        bg_color: str = "#FFFFFF",
+        size: int = 10,
+        border: int = 4,
+        error_correction: int = ERROR_CORRECT_H,
+        style: str = "default",
+        gradient: Tuple[str, str] = None,
+        corner_style: str = "square",
+        dot_style: str = "square"
+) -> str:
+    """
+    Генерирует анимированный QR-код (GIF, либо APNG для .png/.apng)
+
+    :param text: Текст для кодирования
+    :param output_path: Путь для сохранения
+    :param animation: Вид анимации ("gradient", "pulse")
+    :param frames: Число кадров
+    :param duration: Длительность кадра в миллисекундах
+    :return: Путь к сохраненному файлу
+    """
+    if logo_path and not os.path.exists(logo_path):
+        logo_path = None
+
+    qr_matrix = build_qr_matrix(text, error_correction, border)
+    images = render_qr_animation(
+        qr_matrix,
+        animation=animation,
+        frames=frames,
+        logo=logo_path,
+        color=color,
+        bg_color=bg_color,
+        size=size,
+        border=border,
+        style=style,
+        gradient=gradient,
+        corner_style=corner_style,
+        dot_style=dot_style
+    )
+
+    fmt = "PNG" if output_path.lower().endswith((".png", ".apng")) else "GIF"
+    save_animation(images, output_path, fmt, duration)
+    return output_path
@@ -0,0 +1,556 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageColor
+
+from content import build_payloads, CONTENT_TYPES
+from generator import (
+    __version__,
+    apply_style,
+    build_qr_matrix,
+    render_qr,
+    select_error_correction,
+    ERROR_CORRECTION_LEVELS,
+)
+from tiled import should_tile, render_qr_tiled
+from verify import ModuleSampler, verify_qr, verify_samples
+
+# Параметры рендеринга, которые можно задать в строке манифеста
+RENDER_FIELDS = (
+    "logo_path", "color", "bg_color", "size", "border", "error_correction",
+    "style", "gradient", "pattern", "corner_style", "dot_style", "memory_limit",
+)
+
+# Имя файла индекса для инкрементальной генерации (в каталоге результатов)
+INDEX_NAME = ".qrforge-index.jsonl"
+
+# Логотипы воркера: путь -> изображение поверх разделяемой памяти
+_worker_logos = {}
+_worker_segments = []
+
+
+def load_manifest(path: str) -> List[dict]:
+    """
+    Читает манифест пакетной генерации (JSONL или CSV)
+
+    Каждая строка - это text (или type и поля структурированного содержимого
+    из content.CONTENT_TYPES), необязательные id и output и параметры
+    рендеринга из RENDER_FIELDS. Если id не указан, используется номер строки.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = [{k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(f)]
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    for number, row in enumerate(rows, 1):
+        row.setdefault("id", str(number))
+    return rows
+
+
+def output_path(output_dir: str, name: str) -> str:
+    """
+    Путь результата внутри output_dir
+
+    :raises ValueError: Если путь абсолютный или выходит из каталога (через .. или ссылки)
+    """
+    path = os.path.join(output_dir, os.path.normpath(name))
+    base = os.path.realpath(output_dir)
+    if os.path.isabs(name) or os.path.commonpath([base, os.path.realpath(path)]) != base:
+        raise ValueError(f"output вне каталога результатов: {name}")
+    return path
+
+
+def prepare_item(row: dict, defaults: dict = None, output_dir: str = ".") -> dict:
+    """
+    Превращает строку манифеста в задание для рендеринга
+
+    :param row: Строка манифеста
+    :param defaults: Параметры рендеринга по умолчанию (перекрываются строкой)
+    :param output_dir: Каталог для относительных путей output
+    :return: Задание: id, text, output и параметры рендеринга
+    """
+    kind = row.get("type") or "text"
+    if kind not in ("text", "url") and kind not in CONTENT_TYPES:
+        raise ValueError(f"неизвестный тип содержимого {kind}")
+    if not row.get("text"):
+        raise ValueError("не указан text")
+
+    item = {key: value for key, value in (defaults or {}).items() if value is not None}
+    item.update({key: row[key] for key in RENDER_FIELDS if row.get(key) is not None})
+    item["id"] = str(row["id"])
+    item["text"] = str(row["text"])
+    item["output"] = output_path(output_dir, row.get("output") or f"{item['id']}.png")
+
+    for key in ("size", "border", "memory_limit"):
+        if key in item:
+            item[key] = int(item[key])
+    if isinstance(item.get("gradient"), str):
+        item["gradient"] = tuple(part.strip() for part in item["gradient"].split(","))
+    if item.get("gradient") is not None:
+        if len(item["gradient"]) != 2:
+            raise ValueError("gradient должен состоять из двух цветов")
+        item["gradient"] = tuple(item["gradient"])
+    if isinstance(item.get("error_correction"), str):
+        level = item["error_correction"].upper()
+        if level == "AUTO":
+            item["error_correction"] = None
+        elif level in ERROR_CORRECTION_LEVELS:
+            item["error_correction"] = ERROR_CORRECTION_LEVELS[level]
+        else:
+            raise ValueError(f"неизвестный уровень коррекции ошибок {item['error_correction']}")
+    return item
+
+
+def build_contents(rows: List[dict]) -> List[Tuple[str, str]]:
+    """
+    Собирает text для строк со структурированным содержимым (type: wifi, vcard, ...)
+
+    Строки группируются по типу, и каждая группа собирается столбцами за один проход.
+    Строкам с ошибкой text не заполняется.
+
+    :return: Список ошибок (id, сообщение)
+    """
+    groups = {}
+    for row in rows:
+        kind = row.get("type") or "text"
+        if kind in CONTENT_TYPES:
+            groups.setdefault(kind, []).append(row)
+
+    errors = []
+    for kind, group in groups.items():
+        columns = {field: [row.get(field) for row in group] for field in CONTENT_TYPES[kind][0]}
+        payloads, group_errors = build_payloads(kind, columns)
+        for row, payload in zip(group, payloads):
+            if payload is not None:
+                row["text"] = payload
+        errors += [(str(group[index]["id"]), f"{kind}: {error}") for index, error in group_errors]
+    return errors
+
+
+def prepare_items(rows: Iterable[dict], defaults: dict = None, output_dir: str = ".") -> Tuple[List[dict], List[Tuple[str, str]]]:
+    """Готовит задания из строк манифеста, собирая ошибки вместо исключений"""
+    rows = list(rows)
+    errors = build_contents(rows)
+    failed = {item_id for item_id, _ in errors}
+
+    items = []
+    for row in rows:
+        if str(row.get("id")) in failed:
+            continue
+        try:
+            items.append(prepare_item(row, defaults, output_dir))
+        except (ValueError, TypeError) as e:
+            errors.append((str(row.get("id")), str(e)))
+    return items, errors
+
+
+def normalize_color(color: str) -> str:
+    """Приводит цвет к виду #rrggbb (#000, black и #000000 совпадают)"""
+    try:
+        return "#%02x%02x%02x" % ImageColor.getrgb(color)[:3]
+    except ValueError:
+        return color.lower()
+
+
+def canonical_params(item: dict) -> dict:
+    """
+    Приводит параметры задания к каноническому виду
+
+    Стиль раскрывается через apply_style, цвета приводятся к виду #rrggbb,
+    недостающие параметры заменяются значениями по умолчанию, так что задания
+    с одинаковым результатом получают одинаковые параметры.
+    """
+    color, bg_color, gradient, pattern, corner_style, dot_style = apply_style(
+        item.get("style", "default"),
+        item.get("color", "#000000"),
+        item.get("bg_color", "#FFFFFF"),
+        item.get("gradient"),
+        item.get("pattern"),
+        item.get("corner_style", "square"),
+        item.get("dot_style", "square"),
+    )
+    logo_path = item.get("logo_path")
+    error_correction = item.get("error_correction", ERROR_CORRECTION_LEVELS["H"])
+    return {
+        "text": item["text"],
+        "logo": os.path.realpath(logo_path) if logo_path and os.path.exists(logo_path) else None,
+        "size": item.get("size", 10),
+        "border": item.get("border", 4),
+        "error_correction": "auto" if error_correction is None else error_correction,
+        "style": item.get("style", "default"),
+        "color": normalize_color(color),
+        "bg_color": normalize_color(bg_color),
+        "gradient": [normalize_color(c) for c in gradient] if gradient else None,
+        "pattern": pattern,
+        "corner_style": corner_style,
+        "dot_style": dot_style,
+    }
+
+
+def render_key(item: dict) -> str:
+    """Хэш канонических параметров задания"""
+    canonical = json.dumps(canonical_params(item), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def deduplicate(items: List[dict]) -> List[dict]:
+    """
+    Объединяет задания с одинаковыми параметрами
+
+    :return: Уникальные задания; остальные выходные файлы перечислены
+             в поле copies первого задания как (id, output)
+    """
+    unique = {}
+    for item in items:
+        key = render_key(item)
+        if key in unique:
+            unique[key]["copies"].append((item["id"], item["output"]))
+        else:
+            unique[key] = dict(item, copies=[])
+    return list(unique.values())
+
+
+def link_output(source: str, target: str) -> None:
+    """Создает target как жесткую ссылку на source (или копию, если ссылка невозможна)"""
+    if os.path.abspath(source) == os.path.abspath(target):
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        # Другая файловая система или ФС без жестких ссылок
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def share_logos(paths: Iterable[str]) -> Tuple[list, dict]:
+    """
+    Кладет декодированные логотипы в разделяемую память
+
+    :return: (сегменты памяти для освобождения, описания для воркеров:
+             путь -> (имя сегмента, размер, есть ли альфа-канал))
+    """
+    segments, descriptors = [], {}
+    for path in set(paths):
+        if not path or not os.path.exists(path):
+            continue
+        with Image.open(path) as logo:
+            mode = logo.mode
+            logo = logo.convert("RGBA")
+        data = logo.tobytes()
+        segment = shared_memory.SharedMemory(create=True, size=len(data))
+        segment.buf[:len(data)] = data
+        segments.append(segment)
+        # Логотипы без альфа-канала generator делает круглыми, это нужно сохранить
+        descriptors[path] = (segment.name, logo.size, mode == "RGBA")
+    return segments, descriptors
+
+
+def release_logos(segments: list) -> None:
+    """Освобождает разделяемую память логотипов"""
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+
+
+def _init_worker(descriptors: dict) -> None:
+    """Подключает общие логотипы и прогревает конвейер рендеринга в воркере"""
+    for path, (name, logo_size, has_alpha) in descriptors.items():
+        segment = shared_memory.SharedMemory(name=name)
+        _worker_segments.append(segment)
+        logo = Image.frombuffer("RGBA", logo_size, segment.buf, "raw", "RGBA", 0, 1)
+        _worker_logos[path] = logo if has_alpha else logo.convert("RGB")
+
+    # Первый рендер загружает плагины PIL и numpy, чтобы не платить за это в задании
+    render_qr(build_qr_matrix("warm-up"), size=1)
+
+
+def render_item(item: dict, verify: bool = False) -> dict:
+    """
+    Рендерит одно задание прямо в итоговый файл (через временный файл)
+
+    Выходные файлы одинаковых заданий из поля copies связываются с результатом.
+
+    :return: Короткий результат: id, output, copies, error и отчет проверки
+    """
+    result = {"id": item["id"], "output": item["output"], "copies": item.get("copies", []),
+              "error": None, "verify": None}
+    try:
+        params = {key: item[key] for key in RENDER_FIELDS if key in item and key != "logo_path"}
+        memory_limit = params.pop("memory_limit", None)
+        logo_path = item.get("logo_path")
+        logo = _worker_logos.get(logo_path, logo_path)
+        if isinstance(logo, str) and not os.path.exists(logo):
+            logo = None
+
+        error_correction = params.pop("error_correction", ERROR_CORRECTION_LEVELS["H"])
+        if error_correction is None:
+            error_correction = select_error_correction(
+                item["text"], logo, params.get("size", 10), params.get("border", 4)
+            )
+        border = params.get("border", 4)
+        qr_matrix = build_qr_matrix(item["text"], error_correction, border)
+
+        output = item["output"]
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        temp_path = f"{output}.{os.getpid()}.tmp"
+
+        if should_tile(qr_matrix, params.get("size", 10), border, params.get("style", "default"),
+                       params.get("pattern"), memory_limit):
+            # Яркость модулей собираем по полосам, не открывая большой файл целиком
+            sampler = ModuleSampler(len(qr_matrix), params.get("size", 10), border) if verify else None
+            with open(temp_path, "wb") as f:
+                render_qr_tiled(qr_matrix, f, logo=logo, memory_limit=memory_limit,
+                                on_rows=sampler.add_rows if sampler else None, **params)
+            if sampler:
+                result["verify"] = verify_samples(sampler.samples(), qr_matrix, border, error_correction)
+        else:
+            img = render_qr(qr_matrix, logo=logo, **params)
+            if verify:
+                result["verify"] = verify_qr(img, qr_matrix, params.get("size", 10), border, error_correction)
+            img.save(temp_path, format="PNG")
+        os.replace(temp_path, output)
+
+        for _, copy_path in result["copies"]:
+            link_output(output, copy_path)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def _render_item_verified(item: dict) -> dict:
+    return render_item(item, verify=True)
+
+
+def render_batch(items: List[dict], workers: Optional[int] = None, verify: bool = False,
+                 dedup: bool = True, on_result: Callable[[dict], None] = None,
+                 executor: ProcessPoolExecutor = None) -> dict:
+    """
+    Рендерит задания в пуле процессов
+
+    Воркеры пишут PNG сразу в итоговые файлы, в родительский процесс
+    возвращается только короткий результат. Логотипы декодируются один раз
+    и передаются воркерам через разделяемую память без копирования.
+    Одинаковые задания рендерятся один раз, остальные файлы становятся
+    жесткими ссылками на результат.
+
+    :param items: Задания из prepare_items
+    :param workers: Число процессов (по умолчанию - число ядер)
+    :param verify: Проверять читаемость каждого QR-кода
+    :param dedup: Объединять задания с одинаковыми параметрами
+    :param on_result: Вызывается с результатом каждого задания сразу после его получения
+    :param executor: Уже запущенный пул (create_pool); логотипы воркеры тогда читают сами
+    :return: Отчет: total, unique, rendered, linked, failed, unverified, errors, elapsed
+    """
+    started = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+    jobs = deduplicate(items) if dedup else items
+
+    report = {"total": len(items), "unique": len(jobs), "rendered": 0, "linked": 0,
+              "failed": 0, "unverified": [], "errors": []}
+    # Крупные порции уменьшают число обменов с воркерами
+    chunksize = max(1, len(jobs) // (workers * 8))
+    task = _render_item_verified if verify else render_item
+
+    if executor is not None:
+        _collect_results(executor.map(task, jobs, chunksize=chunksize), report, on_result)
+    else:
+        segments, descriptors = share_logos(item.get("logo_path") for item in jobs)
+        try:
+            with create_pool(workers, descriptors) as executor:
+                _collect_results(executor.map(task, jobs, chunksize=chunksize), report, on_result)
+        finally:
+            release_logos(segments)
+
+    report["elapsed"] = time.monotonic() - started
+    return report
+
+
+def create_pool(workers: Optional[int] = None, descriptors: dict = None) -> ProcessPoolExecutor:
+    """Запускает пул воркеров рендеринга (descriptors - общие логотипы из share_logos)"""
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_init_worker,
+                               initargs=(descriptors or {},))
+
+
+def _collect_results(results: Iterable[dict], report: dict, on_result: Callable[[dict], None] = None) -> None:
+    """Сводит результаты заданий в отчет render_batch"""
+    for result in results:
+        if on_result:
+            on_result(result)
+        ids = [result["id"]] + [copy_id for copy_id, _ in result["copies"]]
+        if result["error"]:
+            report["failed"] += len(ids)
+            report["errors"] += [(item_id, result["error"]) for item_id in ids]
+            continue
+        report["rendered"] += 1
+        report["linked"] += len(result["copies"])
+        if result["verify"] and not result["verify"]["passed"]:
+            report["unverified"] += [(item_id, result["verify"]) for item_id in ids]
+
+
+def item_hash(item: dict) -> str:
+    """Хэш параметров задания вместе с версией библиотеки и содержимым логотипа"""
+    logo_path = item.get("logo_path")
+    logo = None
+    if logo_path and os.path.exists(logo_path):
+        stat = os.stat(logo_path)
+        logo = file_digest(os.path.realpath(logo_path), stat.st_size, stat.st_mtime_ns)
+    return hashlib.sha256(f"{__version__}:{render_key(item)}:{logo}".encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def file_digest(path: str, size: int, mtime_ns: int) -> str:
+    """Хэш содержимого файла (размер и время изменения - ключ кэша, чтобы не читать файл заново)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def repair_journal(path: str) -> None:
+    """Обрезает недописанную последнюю строку журнала, чтобы следующая запись не слиплась с ней"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Ищем последний перевод строки с конца файла блоками
+        end = size
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            position = f.read(end - start).rfind(b"\n")
+            if position >= 0:
+                f.truncate(start + position + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+def load_index(path: str) -> dict:
+    """
+    Читает индекс инкрементальной генерации
+
+    Индекс - это журнал строк JSON: {"id", "hash", "output"} после рендеринга
+    и {"id", "deleted": true} после удаления. Недописанная последняя строка
+    (если запуск прервался) пропускается.
+
+    :return: id -> {"hash", "output"}
+    """
+    index = {}
+    if not os.path.exists(path):
+        return index
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("deleted"):
+                index.pop(record["id"], None)
+            else:
+                index[record["id"]] = {"hash": record["hash"], "output": record["output"]}
+    return index
+
+
+def write_index(path: str, index: dict) -> None:
+    """Атомарно перезаписывает индекс в сжатом виде (одна строка на задание)"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for item_id, entry in index.items():
+            f.write(json.dumps({"id": item_id, **entry}, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def render_incremental(items: List[dict], index_path: str, workers: Optional[int] = None,
+                       verify: bool = False, dedup: bool = True) -> dict:
+    """
+    Рендерит только новые и измененные задания по индексу прошлого запуска
+
+    Задание считается неизмененным, если совпадают хэш параметров (с версией
+    библиотеки и содержимым логотипа) и путь результата, а сам файл существует.
+    Файлы заданий, которых больше нет в манифесте, и старые файлы заданий
+    с новым путем output удаляются. Каждый результат сразу
+    дописывается в журнал индекса, поэтому прерванный запуск продолжается
+    с места остановки.
+
+    :param items: Задания из prepare_items
+    :param index_path: Путь к файлу индекса
+    :return: Отчет render_batch плюс added, changed, unchanged, deleted
+    """
+    index = load_index(index_path)
+    hashes = {item["id"]: item_hash(item) for item in items}
+
+    pending, unchanged = [], 0
+    for item in items:
+        entry = index.get(item["id"])
+        if entry and entry["hash"] == hashes[item["id"]] and entry["output"] == item["output"] \
+                and os.path.exists(item["output"]):
+            unchanged += 1
+        else:
+            pending.append(item)
+    added = sum(1 for item in pending if item["id"] not in index)
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    repair_journal(index_path)
+    with open(index_path, "a", encoding="utf-8") as journal:
+        def record(entry: dict) -> None:
+            journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal.flush()
+
+        # Удаляем результаты заданий, которых больше нет в манифесте
+        outputs = {item["output"] for item in items}
+        removed = [item_id for item_id in index if item_id not in hashes]
+        for item_id in removed:
+            output = index[item_id]["output"]
+            if output not in outputs and os.path.exists(output):
+                os.remove(output)
+            record({"id": item_id, "deleted": True})
+
+        # Результаты заданий, у которых поменялся путь output, больше никому не нужны
+        for item in pending:
+            entry = index.get(item["id"])
+            if entry and entry["output"] != item["output"] and entry["output"] not in outputs \
+                    and os.path.exists(entry["output"]):
+                os.remove(entry["output"])
+
+        def on_result(result: dict) -> None:
+            if result["error"]:
+                return
+            # Непрошедшие проверку забываем, чтобы следующий запуск отрендерил и проверил их снова
+            unverified = result["verify"] and not result["verify"]["passed"]
+            for item_id, output in [(result["id"], result["output"])] + result["copies"]:
+                record({"id": item_id, "deleted": True} if unverified
+                       else {"id": item_id, "hash": hashes[item_id], "output": output})
+
+        report = render_batch(pending, workers=workers, verify=verify, dedup=dedup, on_result=on_result)
+        os.fsync(journal.fileno())
+
+    # Сжимаем журнал до актуального состояния
+    write_index(index_path, load_index(index_path))
+
+    report.update({
+        "total": len(items),
+        "added": added,
+        "changed": len(pending) - added,
+        "unchanged": unchanged,
+        "deleted": len(removed),
+    })
+    return report
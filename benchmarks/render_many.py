@@ -0,0 +1,48 @@
+"""
+Замер масштабирования render_many по числу потоков
+
+Запуск из корня проекта:
+    python benchmarks/render_many.py --items 200 --threads 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from generator import render_many  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование render_many по потокам")
+    parser.add_argument("--items", type=int, default=200, help="Число QR-кодов в замере")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="Число потоков")
+    parser.add_argument("--size", type=int, default=10, help="Размер модуля в пикселях")
+    parser.add_argument("--style", default="default", help="Стиль QR-кода")
+    parser.add_argument("--pattern", help="Паттерн (dots, watercolor, cyber)")
+    parser.add_argument("--dot-style", default="circle", help="Стиль точек")
+    args = parser.parse_args()
+
+    items = [
+        {"text": f"https://example.com/item/{index}", "size": args.size, "style": args.style,
+         "pattern": args.pattern, "dot_style": args.dot_style}
+        for index in range(args.items)
+    ]
+
+    # Прогрев: кэш штампов и импорт tiled
+    render_many(items[:4], threads=1)
+
+    print(f"CPU: {os.cpu_count()}, QR-кодов: {args.items}")
+    print(f"{'потоки':>7} {'сек':>8} {'шт/сек':>8} {'ускорение':>10}")
+    baseline = None
+    for threads in args.threads:
+        start = time.perf_counter()
+        render_many(items, threads=threads)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{threads:>7} {elapsed:>8.2f} {args.items / elapsed:>8.1f} {baseline / elapsed:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
 import argparse
-from generator import generate_qr
+import sys
+from generator import generate_qr, build_qr_matrix, select_error_correction, ERROR_CORRECTION_LEVELS
 from encryptor import encrypt, save_key
+from verify import format_report, verify_samples, ModuleSampler
+from batch import load_manifest, prepare_items, render_batch, render_incremental, INDEX_NAME
+from animation import generate_qr_animation, ANIMATIONS
+from content import build_payload, CONTENT_TYPES
+from matrix_io import export_matrices, render_matrix_file
+from watch import watch_directory, watch_stream, DEFAULT_BATCH_SIZE, PROCESSED_DIR, FAILED_DIR
 import os
 from datetime import datetime
 
@@ -10,9 +17,11 @@ def create_parser():
     parser = argparse.ArgumentParser(description='QRForge - Генератор QR-кодов')
 
     # Основные параметры
-    parser.add_argument('text', type=str, help='Текст для кодирования в QR')
+    parser.add_argument('text', type=str, nargs='?', default=None,
+                       help='Текст для кодирования в QR (с --batch - путь к манифесту)')
     parser.add_argument('--output', '-o', type=str, default=None,
-                       help='Имя выходного файла (по умолчанию: qr_<timestamp>.png)')
+                       help='Имя выходного файла (по умолчанию: qr_<timestamp>.png), '
+                            'с --batch - каталог для результатов')
 
     # Внешний вид
     parser.add_argument('--logo', '-l', type=str, default=None,
@@ -41,6 +50,47 @@ def create_parser():
     parser.add_argument('--dot-style', '-ds', type=str, default='square',
                        choices=['square', 'circle', 'rounded', 'diamond'],
                        help='Стиль точек QR-кода')
+    parser.add_argument('--error-correction', '-ec', type=str, default='H',
+                       choices=['L', 'M', 'Q', 'H', 'auto'],
+                       help='Уровень коррекции ошибок; auto - наименьший, при котором '
+                            'логотип укладывается в бюджет коррекции (по умолчанию: H)')
+    parser.add_argument('--memory-limit', '-m', type=int, default=None,
+                       help='Лимит памяти в МБ, выше которого QR-код рендерится полосами '
+                            '(по умолчанию: 256)')
+
+    # Проверка
+    parser.add_argument('--verify', '-v', action='store_true',
+                       help='Проверить, что QR-код читается после стилизации (код выхода 1, если нет)')
+
+    # Анимация
+    parser.add_argument('--animate', '-a', type=str, default=None, choices=list(ANIMATIONS),
+                       help='Анимированный QR-код: бегущий градиент (нужен --gradient или стиль '
+                            'с градиентом) или неоновая пульсация (GIF, либо APNG для .png)')
+    parser.add_argument('--frames', type=int, default=12,
+                       help='Число кадров анимации (по умолчанию: 12)')
+    parser.add_argument('--duration', type=int, default=80,
+                       help='Длительность кадра анимации в мс (по умолчанию: 80)')
+
+    # Пакетная генерация
+    parser.add_argument('--batch', action='store_true',
+                       help='Сгенерировать QR-коды по манифесту JSONL/CSV (text, id, output, '
+                            'параметры стиля); опции стиля задают значения по умолчанию')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                       help='Число процессов для --batch (по умолчанию: число ядер)')
+    parser.add_argument('--incremental', '-i', action='store_true',
+                       help='Рендерить только новые и измененные задания --batch и удалять '
+                            f'результаты удаленных (индекс хранится в {INDEX_NAME} каталога результатов)')
+    parser.add_argument('--no-dedup', action='store_true',
+                       help='Не объединять одинаковые задания --batch (по умолчанию одинаковые '
+                            'QR-коды рендерятся один раз и связываются жесткими ссылками)')
+
+    # Матрицы модулей
+    parser.add_argument('--export-matrix', type=str, default=None, metavar='PATH',
+                       help='Сохранить матрицу модулей в компактный двоичный файл вместо рендеринга '
+                            '(с --batch - все задания манифеста одним файлом)')
+    parser.add_argument('--from-matrix', type=str, default=None, metavar='PATH',
+                       help='Отрендерить все матрицы из файла --export-matrix в PNG '
+                            '(в каталог --output) с текущими опциями стиля')
 
     # Шифрование
     parser.add_argument('--encrypt', '-e', action='store_true',
@@ -50,49 +100,208 @@ def create_parser():
 
     # Тип контента
     parser.add_argument('--type', '-t', type=str, default='text',
-                       choices=['text', 'url', 'wifi', 'vcard'],
+                       choices=['text', 'url'] + list(CONTENT_TYPES),
                        help='Тип содержимого QR-кода (по умолчанию: text)')
+    parser.add_argument('--data', '-d', type=str, action='append', default=None, metavar='KEY=VALUE',
+                       help='Поле структурированного содержимого, например --data ssid=Home '
+                            '--data password=secret (можно повторять)')
+
+    return parser
+
 
+def create_watch_parser():
+    """Создает парсер для режима qrforge watch"""
+    parser = argparse.ArgumentParser(
+        prog='qrforge watch',
+        description='Рендерит файлы заданий JSONL/CSV, появляющиеся в каталоге, '
+                    'или JSON-строки из stdin (DIR = -), не перезапуская процесс'
+    )
+    parser.add_argument('directory', type=str,
+                       help=f'Каталог заданий (обработанные файлы переносятся в {PROCESSED_DIR}/ '
+                            f'и {FAILED_DIR}/) или - для чтения JSON-строк из stdin')
+    parser.add_argument('--output', '-o', type=str, default=None,
+                       help='Каталог для результатов (по умолчанию: DIR/out, для stdin - текущий)')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                       help='Число процессов рендеринга (по умолчанию: число ядер)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Сколько QR-кодов рендерить одной порцией (по умолчанию: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--interval', type=float, default=1.0,
+                       help='Период опроса каталога в секундах, если inotify недоступен (по умолчанию: 1)')
+    parser.add_argument('--verify', '-v', action='store_true',
+                       help='Проверять читаемость; файлы с нечитаемыми QR-кодами уходят в failed/')
+    parser.add_argument('--once', action='store_true',
+                       help='Обработать файлы, которые уже лежат в каталоге, и выйти')
     return parser
 
 
-def generate_wifi_config(ssid: str, password: str, security: str = 'WPA') -> str:
-    """Генерирует строку конфигурации WiFi для QR-кода"""
-    return f"WIFI:T:{security};S:{ssid};P:{password};;"
+def run_watch(argv) -> None:
+    """Режим демона: qrforge watch DIR"""
+    args = create_watch_parser().parse_args(argv)
+
+    if args.directory == '-':
+        # stdout занят ответами по заданиям, поэтому сводка пишется в stderr
+        total = watch_stream(sys.stdin.buffer, args.output or '.', workers=args.workers,
+                             batch_size=args.batch_size, verify=args.verify)
+        print(f"Обработано строк: {total['lines']}, QR-кодов: {total['rendered'] + total['linked']}, "
+              f"ошибок: {len(total['errors'])}", file=sys.stderr)
+        if total["errors"]:
+            sys.exit(1)
+        return
+
+    if not os.path.isdir(args.directory):
+        print(f"Каталог {args.directory} не найден")
+        sys.exit(1)
 
+    def on_batch(summary: dict) -> None:
+        print(f"Файлов: {summary['files']} (с ошибками: {summary['failed_files']}), "
+              f"QR-кодов: {summary['rendered'] + summary['linked']}", flush=True)
+        for item_id, error in summary["errors"]:
+            print(f"  {item_id}: ошибка: {error}", flush=True)
 
-def generate_vcard(name: str, phone: str, email: str = None, org: str = None) -> str:
-    """Генерирует vCard для QR-кода"""
-    vcard = f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nTEL:{phone}"
-    if email:
-        vcard += f"\nEMAIL:{email}"
-    if org:
-        vcard += f"\nORG:{org}"
-    vcard += "\nEND:VCARD"
-    return vcard
+    total = watch_directory(args.directory, args.output, workers=args.workers, batch_size=args.batch_size,
+                            interval=args.interval, verify=args.verify, once=args.once, on_batch=on_batch)
+    if args.once and total["failed_files"]:
+        sys.exit(1)
+
+
+def parse_fields(pairs) -> dict:
+    """Разбирает поля содержимого из аргументов KEY=VALUE"""
+    fields = {}
+    for pair in pairs or []:
+        if '=' not in pair:
+            raise ValueError(f"Поле {pair} должно быть в формате KEY=VALUE")
+        key, value = pair.split('=', 1)
+        fields[key.strip()] = value
+    return fields
+
+
+def run_batch(args) -> None:
+    """Пакетная генерация по манифесту"""
+    defaults = {
+        "logo_path": args.logo,
+        "color": args.color,
+        "bg_color": args.bg,
+        "size": args.size,
+        "border": args.border,
+        "error_correction": args.error_correction,
+        "style": args.style,
+        "gradient": args.gradient,
+        "pattern": args.pattern,
+        "corner_style": args.corner_style,
+        "dot_style": args.dot_style,
+        "memory_limit": args.memory_limit * 1024 * 1024 if args.memory_limit else None,
+    }
+    try:
+        rows = load_manifest(args.text)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения манифеста: {str(e)}")
+        sys.exit(1)
+
+    items, errors = prepare_items(rows, defaults, args.output or ".")
+    output_dir = args.output or "."
+    if args.export_matrix:
+        count = export_matrices(items, args.export_matrix, workers=args.workers)
+        print(f"Сохранено матриц: {count} из {len(rows)} в {args.export_matrix}")
+        for item_id, error in errors:
+            print(f"  {item_id}: ошибка: {error}")
+        if errors:
+            sys.exit(1)
+        return
+
+    if args.incremental:
+        report = render_incremental(items, os.path.join(output_dir, INDEX_NAME), workers=args.workers,
+                                    verify=args.verify, dedup=not args.no_dedup)
+    else:
+        report = render_batch(items, workers=args.workers, verify=args.verify, dedup=not args.no_dedup)
+    errors += report["errors"]
+
+    created = report['rendered'] + report['linked']
+    print(f"Создано QR-кодов: {created} из {len(rows)} за {report['elapsed']:.1f} с")
+    print(f"Уникальных: {report['unique']}, отрендерено: {report['rendered']}, "
+          f"связано с дубликатами: {report['linked']}")
+    if args.incremental:
+        print(f"Новых: {report['added']}, измененных: {report['changed']}, "
+              f"без изменений: {report['unchanged']}, удалено: {report['deleted']}")
+    for item_id, error in errors:
+        print(f"  {item_id}: ошибка: {error}")
+    for item_id, verify_report in report["unverified"]:
+        print(f"  {item_id}: {format_report(verify_report)}")
+    if errors or report["unverified"]:
+        sys.exit(1)
+
+
+def run_from_matrix(args) -> None:
+    """Рендеринг всех матриц из файла --export-matrix"""
+    try:
+        count = render_matrix_file(
+            args.from_matrix,
+            args.output or ".",
+            threads=args.workers,
+            logo_path=args.logo,
+            color=args.color,
+            bg_color=args.bg,
+            size=args.size,
+            border=args.border,
+            style=args.style,
+            gradient=args.gradient,
+            pattern=args.pattern,
+            corner_style=args.corner_style,
+            dot_style=args.dot_style,
+            memory_limit=args.memory_limit * 1024 * 1024 if args.memory_limit else None
+        )
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения файла матриц: {str(e)}")
+        sys.exit(1)
+    print(f"Создано QR-кодов: {count} в {args.output or '.'}")
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        run_watch(sys.argv[2:])
+        return
+
     parser = create_parser()
     args = parser.parse_args()
+    if args.verify and args.animate:
+        parser.error("--verify не поддерживается вместе с --animate")
+    if args.frames < 1:
+        parser.error("--frames должно быть не меньше 1")
+
+    if args.batch:
+        if args.text is None:
+            print("Укажите путь к манифесту")
+            sys.exit(1)
+        run_batch(args)
+        return
+
+    if args.from_matrix:
+        run_from_matrix(args)
+        return
 
     # Обработка типа контента
     content = args.text
-    if args.type == 'wifi':
-        if ':' not in args.text:
-            print("Для WiFi укажите SSID и пароль в формате 'SSID:password'")
+    if args.type in CONTENT_TYPES:
+        try:
+            fields = parse_fields(args.data)
+        except ValueError as e:
+            print(str(e))
             return
-        ssid, password = args.text.split(':', 1)
-        content = generate_wifi_config(ssid, password)
-    elif args.type == 'vcard':
-        parts = args.text.split(':')
-        if len(parts) < 2:
-            print("Для vCard укажите как минимум имя и телефон в формате 'name:phone:email:org'")
+        # Старый формат: поля через двоеточие в тексте
+        if not fields and args.text and args.type == 'wifi':
+            if ':' not in args.text:
+                print("Для WiFi укажите SSID и пароль в формате 'SSID:password' или через --data")
+                return
+            fields = dict(zip(('ssid', 'password'), args.text.split(':', 1)))
+        elif not fields and args.text and args.type == 'vcard':
+            fields = dict(zip(('name', 'phone', 'email', 'org'), args.text.split(':')))
+        try:
+            content = build_payload(args.type, **fields)
+        except ValueError as e:
+            print(f"Ошибка в данных {args.type}: {str(e)}")
             return
-        name, phone = parts[0], parts[1]
-        email = parts[2] if len(parts) > 2 else None
-        org = parts[3] if len(parts) > 3 else None
-        content = generate_vcard(name, phone, email, org)
+    elif content is None:
+        print("Укажите текст для кодирования")
+        return
 
     # Шифрование если нужно
     key = None
@@ -106,7 +315,51 @@ def main():
     output_path = args.output
     if output_path is None:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = f"qr_{timestamp}.png"
+        output_path = f"qr_{timestamp}.{'gif' if args.animate else 'png'}"
+
+    # Уровень коррекции ошибок
+    if args.error_correction == 'auto':
+        error_correction = select_error_correction(content, args.logo, args.size, args.border)
+    else:
+        error_correction = ERROR_CORRECTION_LEVELS[args.error_correction]
+
+    # Только кодирование: матрица модулей без рендеринга
+    if args.export_matrix:
+        export_matrices([{"text": content, "error_correction": error_correction, "border": args.border}],
+                        args.export_matrix, workers=1)
+        print(f"Матрица QR-кода сохранена: {args.export_matrix}")
+        return
+
+    # Генерация анимированного QR-кода
+    if args.animate:
+        try:
+            result_path = generate_qr_animation(
+                text=content,
+                output_path=output_path,
+                animation=args.animate,
+                frames=args.frames,
+                duration=args.duration,
+                logo_path=args.logo,
+                color=args.color,
+                bg_color=args.bg,
+                size=args.size,
+                border=args.border,
+                error_correction=error_correction,
+                style=args.style,
+                gradient=args.gradient,
+                corner_style=args.corner_style,
+                dot_style=args.dot_style
+            )
+            print(f"Анимированный QR-код успешно создан: {result_path}")
+        except Exception as e:
+            print(f"Ошибка при генерации QR-кода: {str(e)}")
+        return
+
+    # Яркость модулей для проверки собираем во время рендеринга, не открывая файл заново
+    sampler = None
+    if args.verify:
+        qr_matrix = build_qr_matrix(content, error_correction, args.border)
+        sampler = ModuleSampler(len(qr_matrix), args.size, args.border)
 
     # Генерация QR-кода
     try:
@@ -118,15 +371,26 @@ def main():
             bg_color=args.bg,
             size=args.size,
             border=args.border,
+            error_correction=error_correction,
             style=args.style,
             gradient=args.gradient,
             pattern=args.pattern,
             corner_style=args.corner_style,
-            dot_style=args.dot_style
+            dot_style=args.dot_style,
+            memory_limit=args.memory_limit * 1024 * 1024 if args.memory_limit else None,
+            on_rows=sampler.add_rows if sampler else None
         )
         print(f"QR-код успешно создан: {result_path}")
     except Exception as e:
         print(f"Ошибка при генерации QR-кода: {str(e)}")
+        return
+
+    # Проверка читаемости
+    if sampler:
+        report = verify_samples(sampler.samples(), qr_matrix, args.border, error_correction)
+        print(f"Проверка: {format_report(report)}")
+        if not report["passed"]:
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+# Экранирование для WIFI: и MECARD: (обратная косая черта перед спецсимволом)
+_MECARD_TABLE = str.maketrans({c: "\\" + c for c in '\\;,:"'})
+
+# Экранирование текстовых значений vCard и iCalendar
+_VCARD_TABLE = str.maketrans({"\\": "\\\\", ";": "\\;", ",": "\\,", "\n": "\\n", "\r": ""})
+
+_PHONE_RE = re.compile(r"^\+?[0-9][0-9 ()\-]*$")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+WIFI_SECURITY = ("WPA", "WEP", "nopass")
+
+
+def _single_line(field: str, value: Optional[str]) -> Optional[str]:
+    """Проверяет поле-адрес (телефон, email, URL): пробелы по краям убираются, переводы строк запрещены"""
+    if value is None:
+        return None
+    if "\r" in value or "\n" in value:
+        raise ValueError(f"{field} не может содержать перевод строки")
+    return value.strip()
+
+
+def _format_coordinate(value: float) -> str:
+    """Координата с точностью до 7 знаков (около 1 см) без лишних нулей"""
+    return f"{value:.7f}".rstrip("0").rstrip(".")
+
+
+def _format_wifi(ssid, password=None, security=None, hidden=None) -> str:
+    if not ssid:
+        raise ValueError("не указан SSID")
+    normalized = {"WPA": "WPA", "WPA2": "WPA", "WPA3": "WPA", "WEP": "WEP", "NOPASS": "nopass", "NONE": "nopass"}
+    security = normalized.get(str(security or "WPA").strip().upper())
+    if security is None:
+        raise ValueError(f"неизвестный тип защиты, доступны: {', '.join(WIFI_SECURITY)}")
+    if security != "nopass" and not password:
+        raise ValueError("не указан пароль")
+
+    payload = f"WIFI:T:{security};S:{ssid};"
+    if security != "nopass":
+        payload += f"P:{password};"
+    if hidden and str(hidden).strip().lower() in ("1", "true", "yes"):
+        payload += "H:true;"
+    return payload + ";"
+
+
+def _format_vcard(name, phone=None, email=None, org=None, title=None, url=None) -> str:
+    if not name:
+        raise ValueError("не указано имя")
+    phone, email, url = (_single_line(*field) for field in (("phone", phone), ("email", email), ("url", url)))
+    if not phone:
+        raise ValueError("не указан телефон")
+    if not _PHONE_RE.fullmatch(phone):
+        raise ValueError(f"некорректный телефон {phone}")
+    if email and not _EMAIL_RE.fullmatch(email):
+        raise ValueError(f"некорректный email {email}")
+
+    vcard = f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nTEL:{phone}"
+    if email:
+        vcard += f"\nEMAIL:{email}"
+    if org:
+        vcard += f"\nORG:{org}"
+    if title:
+        vcard += f"\nTITLE:{title}"
+    if url:
+        vcard += f"\nURL:{url}"
+    vcard += "\nEND:VCARD"
+    return vcard
+
+
+def _format_mecard(name, phone=None, email=None, url=None, note=None) -> str:
+    if not name:
+        raise ValueError("не указано имя")
+    phone, email, url = (_single_line(*field) for field in (("phone", phone), ("email", email), ("url", url)))
+    if phone and not _PHONE_RE.fullmatch(phone):
+        raise ValueError(f"некорректный телефон {phone}")
+
+    payload = f"MECARD:N:{name};"
+    for key, value in (("TEL", phone), ("EMAIL", email), ("URL", url), ("NOTE", note)):
+        if value:
+            payload += f"{key}:{value};"
+    return payload + ";"
+
+
+def _format_geo(latitude, longitude) -> str:
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректные координаты {latitude}, {longitude}")
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValueError(f"координаты вне диапазона: {lat}, {lon}")
+    return f"geo:{_format_coordinate(lat)},{_format_coordinate(lon)}"
+
+
+def _format_sms(number, message=None) -> str:
+    number = _single_line("number", number)
+    if not number:
+        raise ValueError("не указан номер")
+    if not _PHONE_RE.fullmatch(number):
+        raise ValueError(f"некорректный номер {number}")
+    return f"SMSTO:{number}:{message or ''}"
+
+
+def _format_email(address, subject=None, body=None) -> str:
+    address = _single_line("address", address)
+    if not address or not _EMAIL_RE.fullmatch(address):
+        raise ValueError(f"некорректный email {address}")
+
+    params = [f"{key}={quote(value)}" for key, value in (("subject", subject), ("body", body)) if value]
+    return f"mailto:{address}" + ("?" + "&".join(params) if params else "")
+
+
+def _format_event(summary, start, end=None, location=None, description=None) -> str:
+    if not summary:
+        raise ValueError("не указано название события")
+    if not start:
+        raise ValueError("не указано начало события")
+
+    start = parse_datetime(start)
+    # Событие на весь день задается датой без времени
+    kind = "" if isinstance(start, datetime) else ";VALUE=DATE"
+    event = f"BEGIN:VEVENT\nSUMMARY:{summary}\nDTSTART{kind}:{format_datetime(start)}"
+    if end:
+        end = parse_datetime(end)
+        if isinstance(end, datetime) != isinstance(start, datetime):
+            raise ValueError("начало и конец события должны быть оба датами или оба датой со временем")
+        event += f"\nDTEND{kind}:{format_datetime(end)}"
+    if location:
+        event += f"\nLOCATION:{location}"
+    if description:
+        event += f"\nDESCRIPTION:{description}"
+    event += "\nEND:VEVENT"
+    return event
+
+
+# Тип содержимого -> (поле -> таблица экранирования, функция сборки)
+CONTENT_TYPES = {
+    "wifi": ({"ssid": _MECARD_TABLE, "password": _MECARD_TABLE, "security": None, "hidden": None},
+             _format_wifi),
+    "vcard": ({"name": _VCARD_TABLE, "phone": None, "email": None, "org": _VCARD_TABLE,
+               "title": _VCARD_TABLE, "url": None},
+              _format_vcard),
+    "mecard": ({"name": _MECARD_TABLE, "phone": None, "email": _MECARD_TABLE,
+                "url": _MECARD_TABLE, "note": _MECARD_TABLE},
+               _format_mecard),
+    "geo": ({"latitude": None, "longitude": None}, _format_geo),
+    "sms": ({"number": None, "message": None}, _format_sms),
+    "email": ({"address": None, "subject": None, "body": None}, _format_email),
+    "event": ({"summary": _VCARD_TABLE, "start": None, "end": None,
+               "location": _VCARD_TABLE, "description": _VCARD_TABLE},
+              _format_event),
+}
+
+
+def parse_datetime(value):
+    """
+    Приводит строку ISO 8601 к date (только дата) или datetime
+
+    :return: date, datetime или value без изменений, если это не строка
+    """
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    # datetime.fromisoformat принимает и голую дату, поэтому сначала пробуем date
+    for parse in (date.fromisoformat, datetime.fromisoformat):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    raise ValueError(f"некорректная дата {value}")
+
+
+def format_datetime(value) -> str:
+    """Форматирует дату/время для iCalendar (строки принимаются в ISO 8601)"""
+    value = parse_datetime(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        return value.strftime("%Y%m%dT%H%M%S")
+    if isinstance(value, date):
+        return value.strftime("%Y%m%d")
+    raise ValueError(f"некорректная дата {value}")
+
+
+def _escape_column(values: Sequence, table) -> List[Optional[str]]:
+    """
+    Приводит столбец к строкам и экранирует его за один проход
+
+    Пустые и состоящие из пробелов значения становятся None, остальные
+    не обрезаются: пробелы в SSID и пароле значимы.
+    """
+    column = [None if value is None or not str(value).strip() else str(value) for value in values]
+    if table is None:
+        return column
+    return [None if value is None else value.translate(table) for value in column]
+
+
+def build_payloads(kind: str, columns: Dict[str, Sequence]) -> Tuple[List[Optional[str]], List[Tuple[int, str]]]:
+    """
+    Собирает содержимое QR-кодов для целых столбцов (например, из CSV)
+
+    Каждый столбец экранируется целиком, затем строки собираются по одной.
+    Ошибки проверки не прерывают обработку, а собираются в список.
+
+    :param kind: Тип содержимого из CONTENT_TYPES
+    :param columns: Столбцы одинаковой длины: имя поля -> значения (неизвестные поля игнорируются)
+    :return: (содержимое по строкам, None для строк с ошибкой; список (номер строки, ошибка))
+    """
+    if kind not in CONTENT_TYPES:
+        raise ValueError(f"Неизвестный тип содержимого {kind}, доступны: {', '.join(CONTENT_TYPES)}")
+    fields, formatter = CONTENT_TYPES[kind]
+
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Столбцы разной длины: {', '.join(f'{field}={len(values)}' for field, values in columns.items())}")
+    rows = lengths.pop() if lengths else 0
+    escaped = {
+        field: _escape_column(columns.get(field) or [None] * rows, table)
+        for field, table in fields.items()
+    }
+
+    payloads, errors = [], []
+    for index in range(rows):
+        try:
+            payloads.append(formatter(**{field: values[index] for field, values in escaped.items()}))
+        except ValueError as e:
+            payloads.append(None)
+            errors.append((index, str(e)))
+    return payloads, errors
+
+
+def build_payload(kind: str, **fields) -> str:
+    """
+    Собирает содержимое одного QR-кода
+
+    :param kind: Тип содержимого из CONTENT_TYPES
+    :param fields: Поля типа (например, ssid и password для wifi)
+    :return: Готовая строка для кодирования
+    """
+    if kind in CONTENT_TYPES:
+        unknown = set(fields) - set(CONTENT_TYPES[kind][0])
+        if unknown:
+            raise ValueError(f"Неизвестные поля для {kind}: {', '.join(sorted(unknown))}")
+    payloads, errors = build_payloads(kind, {field: [value] for field, value in fields.items()})
+    if errors:
+        raise ValueError(errors[0][1])
+    return payloads[0]
+
+
+def generate_wifi_config(ssid: str, password: str, security: str = 'WPA', hidden: bool = False) -> str:
+    """Генерирует строку конфигурации WiFi для QR-кода"""
+    return build_payload("wifi", ssid=ssid, password=password, security=security,
+                         hidden="true" if hidden else None)
+
+
+def generate_vcard(name: str, phone: str, email: str = None, org: str = None) -> str:
+    """Генерирует vCard для QR-кода"""
+    return build_payload("vcard", name=name, phone=phone, email=email, org=org)
@@ -1,12 +1,32 @@
 import qrcode
-from qrcode.constants import ERROR_CORRECT_H
-from PIL import Image, ImageDraw, ImageOps, ImageFilter
+from qrcode.constants import ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q, ERROR_CORRECT_H
+from qrcode.util import BCH_type_info
+from PIL import Image, ImageColor, ImageDraw, ImageOps, ImageFilter
 import os
 import io
 import random
 import math
-from typing import Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, List, Tuple, Optional
 import numpy as np
+from verify import block_errors, codeword_layout
+
+__version__ = "0.1.0"
+
+# Какую часть бюджета коррекции ошибок может занять логотип
+LOGO_SAFETY = 0.5
+
+# Обозначения уровней коррекции ошибок
+ERROR_CORRECTION_LEVELS = {
+    'L': ERROR_CORRECT_L,
+    'M': ERROR_CORRECT_M,
+    'Q': ERROR_CORRECT_Q,
+    'H': ERROR_CORRECT_H,
+}
+
+# Формы модулей (индексы из module_shape_codes)
+SHAPES = ("square", "circle", "rounded", "diamond", "pointed_tl", "pointed_bl", "pointed_tr")
 
 
 def generate_qr(
@@ -22,7 +42,9 @@ def generate_qr(
         gradient: Tuple[str, str] = None,
         pattern: str = None,
         corner_style: str = "square",
-        dot_style: str = "square"
+        dot_style: str = "square",
+        memory_limit: int = None,
+        on_rows: Callable = None
 ) -> str:
     """
     Генерирует QR-код с расширенными настройками стиля
@@ -34,51 +56,64 @@ def generate_qr(
     :param bg_color: Цвет фона (HEX)
     :param size: Размер QR-кода
     :param border: Размер границы
-    :param error_correction: Уровень коррекции ошибок
+    :param error_correction: Уровень коррекции ошибок (None - наименьший, подходящий под логотип)
     :param style: Стиль QR-кода
     :param gradient: Градиент в виде кортежа (start_color, end_color)
     :param pattern: Паттерн для точек ("circles", "dots", "diamonds", "rounded")
     :param corner_style: Стиль углов ("square", "rounded", "pointed", "circle")
     :param dot_style: Стиль точек ("square", "circle", "rounded", "diamond")
+    :param memory_limit: Лимит памяти в байтах, выше которого PNG рендерится полосами
+    :param on_rows: Получает готовое изображение по частям (полоса, номер первой строки):
+                    полосами при рендеринге полосами, иначе одним изображением PIL.
+                    Например, ModuleSampler.add_rows для проверки без чтения файла
     :return: Путь к сохраненному файлу
     """
-    # Создаем объект QRCode
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=error_correction,
-        box_size=size,
-        border=border,
-    )
-    qr.add_data(text)
-    qr.make(fit=True)
-
-    # Получаем матрицу QR-кода
-    qr_matrix = qr.get_matrix()
-
-    # Применяем стиль
-    color, bg_color, gradient, pattern, corner_style, dot_style = apply_style(
-        style, color, bg_color, gradient, pattern, corner_style, dot_style
-    )
-
-    # Создаем базовое изображение QR-кода с учетом стиля
-    img = create_styled_qr(
+    # Импорт здесь, так как tiled сам использует функции этого модуля
+    from tiled import should_tile, render_qr_tiled
+
+    if error_correction is None:
+        error_correction = select_error_correction(text, logo_path, size, border)
+    qr_matrix = build_qr_matrix(text, error_correction, border)
+
+    # Большие PNG рендерим полосами прямо в файл
+    if output_path.lower().endswith(".png") and \
+            should_tile(qr_matrix, size, border, style, pattern, memory_limit):
+        if isinstance(logo_path, str) and not os.path.exists(logo_path):
+            logo_path = None
+        with open(output_path, "wb") as f:
+            render_qr_tiled(
+                qr_matrix, f,
+                logo=logo_path,
+                color=color,
+                bg_color=bg_color,
+                size=size,
+                border=border,
+                style=style,
+                gradient=gradient,
+                pattern=pattern,
+                corner_style=corner_style,
+                dot_style=dot_style,
+                memory_limit=memory_limit,
+                on_rows=on_rows
+            )
+        return output_path
+
+    img = render_qr(
         qr_matrix=qr_matrix,
-        size=size,
-        border=border,
+        logo=logo_path,
         color=color,
         bg_color=bg_color,
+        size=size,
+        border=border,
+        style=style,
         gradient=gradient,
         pattern=pattern,
         corner_style=corner_style,
         dot_style=dot_style
     )
 
-    # Добавляем логотип если указан
-    if logo_path and os.path.exists(logo_path):
-        img = add_logo(img, logo_path)
-
-    # Применяем эффекты в зависимости от стиля
-    img = apply_effects(img, style)
+    if on_rows:
+        on_rows(img, 0)
 
     # Сохраняем результат
     img.save(output_path)
@@ -97,7 +132,8 @@ def generate_qr_to_bytes(
         gradient: Tuple[str, str] = None,
         pattern: str = None,
         corner_style: str = "square",
-        dot_style: str = "square"
+        dot_style: str = "square",
+        memory_limit: int = None
 ) -> bytes:
     """
     Генерирует QR-код и возвращает его как bytes
@@ -108,35 +144,142 @@ def generate_qr_to_bytes(
     :param bg_color: Цвет фона (HEX)
     :param size: Размер QR-кода
     :param border: Размер границы
-    :param error_correction: Уровень коррекции ошибок
+    :param error_correction: Уровень коррекции ошибок (None - наименьший, подходящий под логотип)
     :param style: Стиль QR-кода
     :param gradient: Градиент в виде кортежа (start_color, end_color)
     :param pattern: Паттерн для точек ("circles", "dots", "diamonds", "rounded")
     :param corner_style: Стиль углов ("square", "rounded", "pointed", "circle")
     :param dot_style: Стиль точек ("square", "circle", "rounded", "diamond")
+    :param memory_limit: Лимит памяти в байтах, выше которого PNG рендерится полосами
     :return: Изображение в виде bytes
     """
+    # Импорт здесь, так как tiled сам использует функции этого модуля
+    from tiled import should_tile, render_qr_tiled
+
     # Создаем временный файл в памяти
     temp_file = io.BytesIO()
 
-    # Генерируем QR-код
+    if error_correction is None:
+        error_correction = select_error_correction(text, logo_path, size, border)
+    qr_matrix = build_qr_matrix(text, error_correction, border)
+
+    # Для больших изображений держим в памяти только сжатый PNG
+    if should_tile(qr_matrix, size, border, style, pattern, memory_limit):
+        if isinstance(logo_path, str) and not os.path.exists(logo_path):
+            logo_path = None
+        render_qr_tiled(
+            qr_matrix, temp_file,
+            logo=logo_path,
+            color=color,
+            bg_color=bg_color,
+            size=size,
+            border=border,
+            style=style,
+            gradient=gradient,
+            pattern=pattern,
+            corner_style=corner_style,
+            dot_style=dot_style,
+            memory_limit=memory_limit
+        )
+        return temp_file.getvalue()
+
+    img = render_qr(
+        qr_matrix=qr_matrix,
+        logo=logo_path,
+        color=color,
+        bg_color=bg_color,
+        size=size,
+        border=border,
+        style=style,
+        gradient=gradient,
+        pattern=pattern,
+        corner_style=corner_style,
+        dot_style=dot_style
+    )
+
+    # Сохраняем в bytes
+    img.save(temp_file, format='PNG')
+    temp_file.seek(0)
+    return temp_file.getvalue()
+
+
+def render_many(items: Iterable[dict], threads: int = None) -> List[bytes]:
+    """
+    Генерирует несколько QR-кодов в PNG параллельно в потоках
+
+    Сборка модулей, фильтры и сжатие PNG выполняются в numpy и PIL без GIL,
+    поэтому потоки масштабируются без запуска процессов и pickle. Под GIL
+    остается кодирование матрицы (qrcode, чистый Python) - оно и ограничивает
+    ускорение на обычном CPython. Общего изменяемого состояния нет, так что
+    функция работает и на CPython без GIL.
+    При заданном random.seed случайные стили (random, abstract) зависят
+    от порядка выполнения потоков.
+
+    :param items: Аргументы generate_qr_to_bytes для каждого QR-кода
+    :param threads: Число потоков (по умолчанию по числу ядер)
+    :return: PNG в том же порядке, что и items
+    """
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as executor:
+        return list(executor.map(lambda item: generate_qr_to_bytes(**item), items))
+
+
+def build_qr_matrix(
+        text: str,
+        error_correction: int = ERROR_CORRECT_H,
+        border: int = 4
+) -> list:
+    """
+    Кодирует текст в матрицу модулей QR-кода (вместе с рамкой)
+
+    :param text: Текст для кодирования
+    :param error_correction: Уровень коррекции ошибок
+    :param border: Размер границы в модулях
+    :return: Матрица модулей (список строк из bool)
+    """
     qr = qrcode.QRCode(
         version=1,
         error_correction=error_correction,
-        box_size=size,
         border=border,
     )
     qr.add_data(text)
     qr.make(fit=True)
+    return qr.get_matrix()
 
-    # Получаем матрицу QR-кода
-    qr_matrix = qr.get_matrix()
 
+def render_qr(
+        qr_matrix,
+        logo=None,
+        color: str = "#000000",
+        bg_color: str = "#FFFFFF",
+        size: int = 10,
+        border: int = 4,
+        style: str = "default",
+        gradient: Tuple[str, str] = None,
+        pattern: str = None,
+        corner_style: str = "square",
+        dot_style: str = "square"
+) -> Image.Image:
+    """
+    Рисует готовую матрицу модулей: стиль, логотип и эффекты
+
+    :param qr_matrix: Матрица модулей из build_qr_matrix
+    :param logo: Путь к логотипу или уже загруженное изображение
+    :return: Изображение QR-кода
+    """
     # Применяем стиль
     color, bg_color, gradient, pattern, corner_style, dot_style = apply_style(
         style, color, bg_color, gradient, pattern, corner_style, dot_style
     )
 
+    # Логотип готовим заранее, чтобы не рисовать модули, которые он закроет
+    if isinstance(logo, str) and not os.path.exists(logo):
+        logo = None
+    placement = place_logo(logo, qr_matrix, size, border) if logo is not None else None
+    skip_modules = placement[2] if placement else None
+    if pattern == "watercolor":
+        # Размытие паттерна растаскивает модули из-под логотипа за его край
+        skip_modules = None
+
     # Создаем базовое изображение QR-кода с учетом стиля
     img = create_styled_qr(
         qr_matrix=qr_matrix,
@@ -147,20 +290,17 @@ def generate_qr_to_bytes(
         gradient=gradient,
         pattern=pattern,
         corner_style=corner_style,
-        dot_style=dot_style
+        dot_style=dot_style,
+        skip_modules=skip_modules
     )
 
     # Добавляем логотип если указан
-    if logo_path and os.path.exists(logo_path):
-        img = add_logo(img, logo_path)
+    if placement:
+        prepared_logo, pos, _ = placement
+        img.paste(prepared_logo, pos, prepared_logo)
 
     # Применяем эффекты в зависимости от стиля
-    img = apply_effects(img, style)
-
-    # Сохраняем в bytes
-    img.save(temp_file, format='PNG')
-    temp_file.seek(0)
-    return temp_file.getvalue()
+    return apply_effects(img, style)
 
 
 def apply_style(
@@ -285,123 +425,301 @@ def create_styled_qr(
         gradient: Optional[Tuple[str, str]],
         pattern: Optional[str],
         corner_style: str,
-        dot_style: str
+        dot_style: str,
+        skip_modules: set = None
 ) -> Image.Image:
-    """Создает QR-код с применением стилей"""
-    # Размеры изображения
+    """Создает QR-код с применением стилей (skip_modules - модули, которые не рисуются)"""
+    # Рисуем QR-код с учетом стиля
+    arr = compose_modules(qr_matrix, size, border, color, bg_color, gradient, corner_style, dot_style,
+                          skip_modules=skip_modules)
+    img = Image.fromarray(arr, "RGB")
+
+    # Применяем паттерны если нужно
+    return apply_pattern(img, pattern, color)
+
+
+def compose_modules(
+        qr_matrix,
+        size: int,
+        border: int,
+        color: str,
+        bg_color: str,
+        gradient: Optional[Tuple[str, str]],
+        corner_style: str,
+        dot_style: str,
+        skip_modules: set = None
+) -> np.ndarray:
+    """
+    Собирает изображение модулей целиком средствами numpy
+
+    Каждая форма рисуется один раз в штамп (module_stamp), штампы раскладываются
+    по матрице, а цвета переносятся через np.copyto. Результат совпадает
+    с draw_modules попиксельно, но почти вся работа идет без GIL.
+
+    :return: Массив (img_size, img_size, 3), uint8
+    """
     matrix_size = len(qr_matrix)
     img_size = matrix_size * size + 2 * border * size
-    img = Image.new("RGB", (img_size, img_size), bg_color)
-    draw = ImageDraw.Draw(img)
+    codes = module_shape_codes(qr_matrix, corner_style, dot_style, skip_modules=skip_modules)
+
+    # Модуль занимает size + 1 пикселей, поэтому без рамки последний столбец
+    # заходит за край изображения - рисуем с запасом и обрезаем
+    pad = size if border == 0 else 0
+    canvas = np.empty((img_size + pad, img_size + pad, 3), dtype=np.uint8)
+    canvas[:] = ImageColor.getcolor(bg_color, "RGB")
+
+    if gradient:
+        start = np.array(hex_to_rgb(gradient[0]), dtype=np.float64)
+        end = np.array(hex_to_rgb(gradient[1]), dtype=np.float64)
+        position = np.arange(matrix_size) * size
+        ratio = (position[:, None] + position[None, :]) / (img_size * 2)
+        fill = (start + (end - start) * ratio[..., None]).astype(np.uint8)[:, None, :, None]
+    else:
+        fill = np.array(ImageColor.getcolor(color, "RGB"), dtype=np.uint8)
+
+    span = matrix_size * size
+    origin = border * size
+    shapes = [(code, module_stamp(SHAPES[code], size)) for code in np.unique(codes[codes >= 0])]
+
+    # Штамп делится на клетку модуля и полосы, заходящие на соседей справа,
+    # снизу и по диагонали. Модули рисуются построчно, поэтому на общих пикселях
+    # побеждает клетка, затем правый сосед, нижний и диагональный - накладываем
+    # части в обратном порядке.
+    for dy, dx in ((1, 1), (1, 0), (0, 1), (0, 0)):
+        top, left = origin + dy * size, origin + dx * size
+        cells = canvas[top:top + span, left:left + span].reshape(matrix_size, size, matrix_size, size, 3)
+        cell_rows = slice(0, 1) if dy else slice(None)
+        cell_cols = slice(0, 1) if dx else slice(None)
+        target = cells[:, cell_rows, :, cell_cols]
+
+        mask = np.zeros(target.shape[:4], dtype=bool)
+        for code, stamp in shapes:
+            piece = stamp[size:, :] if dy else stamp[:size, :]
+            piece = piece[:, size:] if dx else piece[:, :size]
+            mask |= (codes == code)[:, None, :, None] & piece[None, :, None, :]
+        np.copyto(target, fill, where=mask[..., None])
+
+    return canvas[:img_size, :img_size] if pad else canvas
+
+
+def apply_pattern(img: Image.Image, pattern: Optional[str], color: str, offset_y: int = 0) -> Image.Image:
+    """Применяет паттерн к нарисованным модулям (offset_y - сдвиг полосы от верха изображения)"""
+    if pattern == "dots":
+        img = apply_dots_pattern(img, color, offset_y)
+    elif pattern == "watercolor":
+        img = apply_watercolor_effect(img)
+    elif pattern == "cyber":
+        img = apply_cyber_effect(img)
+
+    return img
 
-    # Функция для определения цвета с учетом градиента
-    def get_color(x: int, y: int) -> str:
-        if not gradient:
-            return color
 
-        # Преобразуем HEX в RGB
-        def hex_to_rgb(hex_color):
-            hex_color = hex_color.lstrip('#')
-            return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
+    """Преобразует HEX в RGB"""
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
 
-        start_rgb = hex_to_rgb(gradient[0])
-        end_rgb = hex_to_rgb(gradient[1])
 
-        # Интерполяция цвета
-        ratio = (x + y) / (img_size * 2)
-        r = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * ratio)
-        g = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * ratio)
-        h = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * ratio)
+def get_module_color(
+        x: int,
+        y: int,
+        color: str,
+        gradient: Optional[Tuple[str, str]],
+        img_size: int
+) -> str:
+    """Определяет цвет модуля с учетом градиента"""
+    if not gradient:
+        return color
 
-        return f"#{r:02x}{g:02x}{h:02x}"
+    start_rgb = hex_to_rgb(gradient[0])
+    end_rgb = hex_to_rgb(gradient[1])
 
-    # Рисуем QR-код с учетом стиля
+    # Интерполяция цвета
+    ratio = (x + y) / (img_size * 2)
+    r = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * ratio)
+    g = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * ratio)
+    h = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * ratio)
+
+    return f"#{r:02x}{g:02x}{h:02x}"
+
+
+def choose_random_shapes(qr_matrix, corner_style: str, dot_style: str) -> dict:
+    """
+    Заранее выбирает формы для модулей со стилем "random"
+
+    Порядок вызовов random.choice совпадает с отрисовкой целиком,
+    поэтому при одинаковом seed результат не зависит от разбиения на полосы.
+    """
+    matrix_size = len(qr_matrix)
+    shapes = {}
     for y in range(matrix_size):
         for x in range(matrix_size):
             if qr_matrix[y][x]:
-                pixel_color = get_color(x * size, y * size)
-                left = x * size + border * size
-                top = y * size + border * size
-                right = left + size
-                bottom = top + size
-
-                # Определяем стиль углов (для позиционных узоров)
                 is_corner = (
                         (x < 8 and y < 8) or
                         (x < 8 and y >= matrix_size - 8) or
                         (x >= matrix_size - 8 and y < 8)
                 )
+                if (corner_style if is_corner else dot_style) == "random":
+                    shapes[(x, y)] = random.choice(["square", "circle", "diamond"])
+    return shapes
 
-                current_style = corner_style if is_corner else dot_style
-
-                # Рисуем элемент в соответствии со стилем
-                if current_style == "circle":
-                    draw.ellipse([left, top, right, bottom], fill=pixel_color)
-                elif current_style == "rounded":
-                    radius = size // 4
-                    draw.rounded_rectangle([left, top, right, bottom], radius=radius, fill=pixel_color)
-                elif current_style == "diamond":
-                    draw.polygon(
-                        [(left + size // 2, top), (right, top + size // 2),
-                         (left + size // 2, bottom), (left, top + size // 2)],
-                        fill=pixel_color
-                    )
-                elif current_style == "pointed":
-                    if is_corner:
-                        # Для углов делаем заостренные углы
-                        if x < 8 and y < 8:  # Левый верхний угол
-                            draw.polygon(
-                                [(left, top + size), (left + size, top), (left + size, top + size)],
-                                fill=pixel_color
-                            )
-                        elif x < 8 and y >= matrix_size - 8:  # Левый нижний угол
-                            draw.polygon(
-                                [(left, top), (left + size, top + size), (left + size, top)],
-                                fill=pixel_color
-                            )
-                        elif x >= matrix_size - 8 and y < 8:  # Правый верхний угол
-                            draw.polygon(
-                                [(left, top), (left + size, top + size), (left, top + size)],
-                                fill=pixel_color
-                            )
-                        else:
-                            draw.rectangle([left, top, right, bottom], fill=pixel_color)
-                    else:
-                        draw.rectangle([left, top, right, bottom], fill=pixel_color)
-                elif current_style == "random":
-                    shapes = ["square", "circle", "diamond"]
-                    chosen_style = random.choice(shapes)
-                    if chosen_style == "square":
-                        draw.rectangle([left, top, right, bottom], fill=pixel_color)
-                    elif chosen_style == "circle":
-                        draw.ellipse([left, top, right, bottom], fill=pixel_color)
-                    elif chosen_style == "diamond":
-                        draw.polygon(
-                            [(left + size // 2, top), (right, top + size // 2),
-                             (left + size // 2, bottom), (left, top + size // 2)],
-                            fill=pixel_color
-                        )
-                else:  # square по умолчанию
-                    draw.rectangle([left, top, right, bottom], fill=pixel_color)
 
-    # Применяем паттерны если нужно
-    if pattern == "dots":
-        img = apply_dots_pattern(img, color)
-    elif pattern == "watercolor":
-        img = apply_watercolor_effect(img)
-    elif pattern == "cyber":
-        img = apply_cyber_effect(img)
+def module_shape_codes(
+        qr_matrix,
+        corner_style: str,
+        dot_style: str,
+        random_shapes: dict = None,
+        skip_modules: set = None
+) -> np.ndarray:
+    """
+    Определяет форму каждого модуля
 
+    :param random_shapes: Заранее выбранные формы из choose_random_shapes
+    :param skip_modules: Координаты (x, y) модулей, которые не нужно рисовать
+    :return: Массив (y, x) с индексами в SHAPES, -1 - модуль не рисуется
+    """
+    dark = np.asarray(qr_matrix, dtype=bool)
+    matrix_size = len(dark)
+    ys, xs = np.indices(dark.shape)
+    top_left = (xs < 8) & (ys < 8)
+    bottom_left = (xs < 8) & (ys >= matrix_size - 8) & ~top_left
+    top_right = (xs >= matrix_size - 8) & (ys < 8) & ~top_left & ~bottom_left
+
+    # Стиль углов (для позиционных узоров) и стиль остальных модулей
+    is_corner = top_left | bottom_left | top_right
+    codes = np.full(dark.shape, -1, dtype=np.int8)
+    for region, style in ((~is_corner, dot_style), (is_corner, corner_style)):
+        selected = dark & region
+        if style in ("circle", "rounded", "diamond"):
+            codes[selected] = SHAPES.index(style)
+        else:  # square по умолчанию, pointed и random уточняются ниже
+            codes[selected] = SHAPES.index("square")
+        if style == "pointed":
+            # Для углов делаем заостренные углы
+            for corner, shape in ((top_left, "pointed_tl"), (bottom_left, "pointed_bl"), (top_right, "pointed_tr")):
+                codes[selected & corner] = SHAPES.index(shape)
+
+    # Случайную форму выбираем и для пропущенных модулей,
+    # чтобы последовательность random не зависела от логотипа
+    random_region = np.zeros(dark.shape, dtype=bool)
+    if corner_style == "random":
+        random_region |= is_corner
+    if dot_style == "random":
+        random_region |= ~is_corner
+    for y, x in zip(*np.nonzero(dark & random_region)):
+        if random_shapes is not None:
+            chosen_style = random_shapes[(x, y)]
+        else:
+            chosen_style = random.choice(["square", "circle", "diamond"])
+        codes[y, x] = SHAPES.index(chosen_style)
+
+    for x, y in skip_modules or ():
+        codes[y, x] = -1
+    return codes
+
+
+@lru_cache(maxsize=64)
+def module_stamp(shape: str, size: int) -> np.ndarray:
+    """Рисует одну форму модуля в маску (size + 1) x (size + 1), как ее рисует ImageDraw"""
+    img = Image.new("L", (size + 1, size + 1), 0)
+    draw_module_shape(ImageDraw.Draw(img), shape, 0, 0, size, 255)
+    stamp = np.asarray(img) > 0
+    # Штамп общий для всех потоков, поэтому только для чтения
+    stamp.flags.writeable = False
+    return stamp
+
+
+def draw_module_shape(draw: ImageDraw.ImageDraw, shape: str, left: int, top: int, size: int, fill) -> None:
+    """Рисует один модуль формы shape (из SHAPES) с левым верхним углом в (left, top)"""
+    right = left + size
+    bottom = top + size
+    if shape == "circle":
+        draw.ellipse([left, top, right, bottom], fill=fill)
+    elif shape == "rounded":
+        radius = size // 4
+        draw.rounded_rectangle([left, top, right, bottom], radius=radius, fill=fill)
+    elif shape == "diamond":
+        draw.polygon(
+            [(left + size // 2, top), (right, top + size // 2),
+             (left + size // 2, bottom), (left, top + size // 2)],
+            fill=fill
+        )
+    elif shape == "pointed_tl":  # Левый верхний угол
+        draw.polygon([(left, top + size), (left + size, top), (left + size, top + size)], fill=fill)
+    elif shape == "pointed_bl":  # Левый нижний угол
+        draw.polygon([(left, top), (left + size, top + size), (left + size, top)], fill=fill)
+    elif shape == "pointed_tr":  # Правый верхний угол
+        draw.polygon([(left, top), (left + size, top + size), (left, top + size)], fill=fill)
+    else:  # square по умолчанию
+        draw.rectangle([left, top, right, bottom], fill=fill)
+
+
+def draw_modules(
+        draw: ImageDraw.ImageDraw,
+        qr_matrix,
+        size: int,
+        border: int,
+        color: str,
+        gradient: Optional[Tuple[str, str]],
+        corner_style: str,
+        dot_style: str,
+        rows: range = None,
+        offset_y: int = 0,
+        random_shapes: dict = None,
+        skip_modules: set = None
+) -> None:
+    """
+    Рисует модули QR-кода по одному через ImageDraw (для полос и масок)
+
+    :param rows: Какие строки матрицы рисовать (по умолчанию все)
+    :param offset_y: Сдвиг по вертикали, если рисуем в полосу изображения
+    :param random_shapes: Заранее выбранные формы из choose_random_shapes
+    :param skip_modules: Координаты (x, y) модулей, которые не нужно рисовать
+    """
+    matrix_size = len(qr_matrix)
+    img_size = matrix_size * size + 2 * border * size
+    if rows is None:
+        rows = range(matrix_size)
+
+    codes = module_shape_codes(qr_matrix, corner_style, dot_style, random_shapes, skip_modules)
+    for y in rows:
+        for x in np.flatnonzero(codes[y] >= 0).tolist():
+            pixel_color = get_module_color(x * size, y * size, color, gradient, img_size)
+            draw_module_shape(draw, SHAPES[codes[y, x]], x * size + border * size,
+                              y * size + border * size - offset_y, size, pixel_color)
+
+
+def add_logo(img: Image.Image, logo_path, max_size: int = None) -> Image.Image:
+    """
+    Добавляет логотип в центр QR-кода
+
+    :param logo_path: Путь к логотипу или уже загруженное изображение
+    :param max_size: Наибольшая сторона логотипа в пикселях (по умолчанию четверть QR-кода)
+    """
+    logo = prepare_logo(logo_path, img.size, max_size)
+
+    # Позиционируем логотип по центру
+    qr_width, qr_height = img.size
+    pos = ((qr_width - logo.size[0]) // 2, (qr_height - logo.size[1]) // 2)
+
+    # Вставляем логотип
+    img.paste(logo, pos, logo)
     return img
 
 
-def add_logo(img: Image.Image, logo_path: str) -> Image.Image:
-    """Добавляет логотип в центр QR-кода"""
-    logo = Image.open(logo_path)
+def prepare_logo(logo_path, img_size: Tuple[int, int], max_size: int = None) -> Image.Image:
+    """Масштабирует логотип под размер QR-кода и добавляет маску прозрачности"""
+    if isinstance(logo_path, Image.Image):
+        logo = logo_path.copy()
+    else:
+        logo = Image.open(logo_path)
 
     # Рассчитываем размер логотипа (15-25% от размера QR)
-    qr_width, qr_height = img.size
+    qr_width, qr_height = img_size
     logo_size = min(qr_width, qr_height) // 4
+    if max_size is not None:
+        logo_size = min(logo_size, max_size)
 
     # Масштабируем логотип
     logo.thumbnail((logo_size, logo_size), Image.LANCZOS)
@@ -413,38 +731,182 @@ def add_logo(img: Image.Image, logo_path: str) -> Image.Image:
         draw.ellipse((0, 0, logo.size[0], logo.size[1]), fill=255)
         logo.putalpha(mask)
 
-    # Позиционируем логотип по центру
-    pos = ((qr_width - logo.size[0]) // 2, (qr_height - logo.size[1]) // 2)
+    return logo
 
-    # Вставляем логотип
-    img.paste(logo, pos, logo)
-    return img
 
+def place_logo(logo, qr_matrix, size: int, border: int, safety: float = LOGO_SAFETY):
+    """
+    Подбирает размер логотипа под бюджет коррекции ошибок и готовит его к вставке
 
-def apply_effects(img: Image.Image, style: str) -> Image.Image:
-    """Применяет дополнительные эффекты в зависимости от стиля"""
+    :param logo: Путь к логотипу или уже загруженное изображение
+    :param qr_matrix: Матрица модулей из build_qr_matrix
+    :return: (логотип, позиция, модули под непрозрачной частью логотипа)
+             или None, если логотип не помещается
+    """
+    matrix_size = len(qr_matrix)
+    img_size = matrix_size * size + 2 * border * size
+    max_size = fit_logo_size(qr_matrix, size, border, safety=safety)
+    if max_size <= 0:
+        return None
+
+    prepared_logo = prepare_logo(logo, (img_size, img_size), max_size)
+    pos = ((img_size - prepared_logo.size[0]) // 2, (img_size - prepared_logo.size[1]) // 2)
+    return prepared_logo, pos, covered_dark_modules(prepared_logo, pos, qr_matrix, size, border)
+
+
+def read_format_info(qr_matrix, border: int) -> Tuple[int, int]:
+    """
+    Читает уровень коррекции ошибок и маску из служебных модулей матрицы
+
+    :param qr_matrix: Матрица модулей (с рамкой border)
+    :return: (error_correction, mask_pattern)
+    """
+    modules_count = len(qr_matrix) - 2 * border
+
+    def module(row: int) -> bool:
+        return bool(qr_matrix[border + row][border + 8])
+
+    # Вертикальная копия формата в столбце 8 (та же раскладка, что в qrcode)
+    bits = 0
+    for i in range(15):
+        if i < 6:
+            row = i
+        elif i < 8:
+            row = i + 1
+        else:
+            row = modules_count - 15 + i
+        bits |= module(row) << i
+
+    # Выбираем ближайшее допустимое значение BCH-кода
+    candidates = [(ec, mask) for ec in range(4) for mask in range(8)]
+    return min(candidates, key=lambda c: bin(BCH_type_info((c[0] << 3) | c[1]) ^ bits).count("1"))
+
+
+def covered_span(matrix_size: int, size: int, border: int, logo_size: int) -> Tuple[int, int]:
+    """
+    Находит модули символа, которые задевает квадратный логотип стороной logo_size по центру
+
+    :return: (first, end) - полуинтервал номеров строк и столбцов символа (без рамки)
+    """
+    img_size = matrix_size * size + 2 * border * size
+    start = (img_size - logo_size) // 2
+    end = start + logo_size
+
+    # Модуль j матрицы занимает пиксели [(j + border) * size, (j + border + 1) * size)
+    columns = np.arange(border, matrix_size - border)
+    lefts = (columns + border) * size
+    covered = np.nonzero((lefts < end) & (lefts + size > start))[0]
+    if not len(covered):
+        return 0, 0
+    return int(covered[0]), int(covered[-1]) + 1
+
+
+def fit_logo_size(
+        qr_matrix,
+        size: int,
+        border: int,
+        error_correction: int = None,
+        safety: float = LOGO_SAFETY
+) -> int:
+    """
+    Находит наибольшую сторону логотипа в пикселях (не больше четверти QR-кода),
+    при которой испорченные кодовые слова в каждом блоке Рида-Соломона
+    укладываются в safety от его исправляющей способности
+
+    Любой модуль под логотипом считается испорченным, а кодовое слово -
+    испорченным, если испорчен хотя бы один его модуль.
+    """
+    if error_correction is None:
+        error_correction = read_format_info(qr_matrix, border)[0]
+
+    matrix_size = len(qr_matrix)
+    symbol_size = matrix_size - 2 * border
+    limit = safety * codeword_layout((symbol_size - 17) // 4, error_correction)[2]
+
+    img_size = matrix_size * size + 2 * border * size
+    logo_size = img_size // 4
+    fits = {}
+    while logo_size > 0:
+        # Число задетых модулей меняется скачками, поэтому проверяем каждый охват один раз
+        first, end = covered_span(matrix_size, size, border, logo_size)
+        if (first, end) not in fits:
+            wrong = np.zeros((symbol_size, symbol_size), dtype=bool)
+            wrong[first:end, first:end] = True
+            fits[first, end] = bool((block_errors(wrong, error_correction) <= limit).all())
+        if fits[first, end]:
+            break
+        logo_size -= 1
+    return logo_size
+
+
+def covered_dark_modules(logo: Image.Image, pos: Tuple[int, int], qr_matrix, size: int, border: int) -> set:
+    """
+    Находит темные модули, которые целиком лежат под непрозрачной частью логотипа
+
+    Модуль рисуется с захватом одного пикселя справа и снизу, поэтому проверяется
+    квадрат size + 1, и пропуск таких модулей не меняет итоговое изображение.
+    """
+    alpha = np.asarray(logo.getchannel("A"))
+    height, width = alpha.shape
+    covered = set()
+    for y, row in enumerate(qr_matrix):
+        top = (y + border) * size - pos[1]
+        if top < 0 or top + size >= height:
+            continue
+        for x, value in enumerate(row):
+            left = (x + border) * size - pos[0]
+            if not value or left < 0 or left + size >= width:
+                continue
+            if alpha[top:top + size + 1, left:left + size + 1].min() == 255:
+                covered.add((x, y))
+    return covered
+
+
+def select_error_correction(text: str, logo_path=None, size: int = 10, border: int = 4) -> int:
+    """
+    Выбирает наименьший уровень коррекции ошибок (и тем самым наименьшую версию),
+    при котором логотип обычного размера укладывается в бюджет коррекции
+
+    :param logo_path: Путь к логотипу или изображение (None - без логотипа)
+    :return: Уровень коррекции ошибок
+    """
+    if isinstance(logo_path, str) and not os.path.exists(logo_path):
+        logo_path = None
+
+    for error_correction in (ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q, ERROR_CORRECT_H):
+        if logo_path is None:
+            return error_correction
+        qr_matrix = build_qr_matrix(text, error_correction, border)
+        img_size = len(qr_matrix) * size + 2 * border * size
+        if fit_logo_size(qr_matrix, size, border, error_correction) >= img_size // 4:
+            return error_correction
+    return ERROR_CORRECT_H
+
+
+def apply_effects(
+        img: Image.Image,
+        style: str,
+        offset_y: int = 0,
+        circles: list = None
+) -> Image.Image:
+    """
+    Применяет дополнительные эффекты в зависимости от стиля
+
+    :param offset_y: Сдвиг полосы от верха изображения (для рендеринга полосами)
+    :param circles: Заранее выбранные круги стиля abstract (по умолчанию случайные)
+    """
     if style == "watercolor":
         # Эффект акварели
         img = img.filter(ImageFilter.GaussianBlur(radius=1))
         img = Image.blend(img, Image.new("RGB", img.size, "#FFFFFF"), 0.1)
     elif style == "cyber":
         # Добавляем сетку
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
-        grid_size = 20
-        for x in range(0, width, grid_size):
-            draw.line([(x, 0), (x, height)], fill="#00FF41", width=1)
-        for y in range(0, height, grid_size):
-            draw.line([(0, y), (width, y)], fill="#00FF41", width=1)
+        draw_cyber_grid(ImageDraw.Draw(img), img.width, img.height, offset_y)
     elif style == "abstract":
         # Добавляем случайные круги на фон
-        draw = ImageDraw.Draw(img)
-        for _ in range(20):
-            x = random.randint(0, img.width)
-            y = random.randint(0, img.height)
-            radius = random.randint(5, 30)
-            color = random.choice(["#FF5722", "#FF9800", "#FFC107", "#FFEB3B"])
-            draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+        if circles is None:
+            circles = random_circles(img.width, img.height)
+        draw_circles(ImageDraw.Draw(img), circles, offset_y)
     elif style == "neon":
         # Добавляем свечение
         glow = img.filter(ImageFilter.GaussianBlur(radius=3))
@@ -453,21 +915,52 @@ def apply_effects(img: Image.Image, style: str) -> Image.Image:
     return img
 
 
-def apply_dots_pattern(img: Image.Image, color: str) -> Image.Image:
-    """Применяет точечный паттерн к QR-коду"""
+def draw_cyber_grid(draw: ImageDraw.ImageDraw, width: int, height: int, offset_y: int = 0) -> None:
+    """Рисует сетку стиля cyber (offset_y - сдвиг полосы от верха изображения)"""
+    grid_size = 20
+    for x in range(0, width, grid_size):
+        draw.line([(x, 0), (x, height)], fill="#00FF41", width=1)
+    for y in range(-offset_y % grid_size, height, grid_size):
+        draw.line([(0, y), (width, y)], fill="#00FF41", width=1)
+
+
+def random_circles(width: int, height: int) -> list:
+    """Выбирает случайные круги стиля abstract: (x, y, radius, color)"""
+    circles = []
+    for _ in range(20):
+        x = random.randint(0, width)
+        y = random.randint(0, height)
+        radius = random.randint(5, 30)
+        color = random.choice(["#FF5722", "#FF9800", "#FFC107", "#FFEB3B"])
+        circles.append((x, y, radius, color))
+    return circles
+
+
+def draw_circles(draw: ImageDraw.ImageDraw, circles: list, offset_y: int = 0) -> None:
+    """Рисует круги из random_circles"""
+    for x, y, radius, color in circles:
+        y -= offset_y
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+
+
+def apply_dots_pattern(img: Image.Image, color: str, offset_y: int = 0) -> Image.Image:
+    """Применяет точечный паттерн к QR-коду (offset_y - сдвиг полосы от верха изображения)"""
     width, height = img.size
-    pattern = Image.new("RGB", (width, height), "#FFFFFF")
-    draw = ImageDraw.Draw(pattern)
 
-    # Рисуем точки
+    # Точки не перекрываются, поэтому паттерн - повторение одной клетки spacing x spacing
     dot_size = 2
     spacing = 4
-    for y in range(0, height, spacing):
-        for x in range(0, width, spacing):
-            draw.ellipse([x, y, x + dot_size, y + dot_size], fill=color)
+    cell = Image.new("L", (spacing, spacing), 0)
+    ImageDraw.Draw(cell).ellipse([0, 0, dot_size, dot_size], fill=255)
+    cell = np.asarray(cell) > 0
+    shift = offset_y % spacing
+    mask = np.tile(cell, (height // spacing + 2, width // spacing + 1))[shift:shift + height, :width]
+
+    pattern = np.full((height, width, 3), 255, dtype=np.uint8)
+    np.copyto(pattern, np.array(ImageColor.getcolor(color, "RGB"), dtype=np.uint8), where=mask[..., None])
 
     # Накладываем паттерн на QR-код
-    img = Image.blend(img, pattern, 0.2)
+    img = Image.blend(img, Image.fromarray(pattern, "RGB"), 0.2)
     return img
 
 
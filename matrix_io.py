@@ -0,0 +1,328 @@
+import io
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from batch import output_path
+from generator import (
+    build_qr_matrix,
+    read_format_info,
+    render_qr,
+    select_error_correction,
+    ERROR_CORRECTION_LEVELS,
+)
+
+# Заголовок файла матриц: сигнатура, версия формата, резерв, число записей,
+# смещения таблицы записей и таблицы id
+FILE_MAGIC = b"QRMX"
+FORMAT_VERSION = 2
+FILE_HEADER = struct.Struct("<4sHHQQQ")
+
+# Заголовок записи: версия QR, уровень коррекции ошибок (константа qrcode), маска, рамка в модулях
+RECORD_HEADER = struct.Struct("<BBBB")
+
+
+def symbol_size(version: int) -> int:
+    """Размер символа QR в модулях (без рамки) для версии 1-40"""
+    return 17 + 4 * version
+
+
+def record_size(version: int) -> int:
+    """Размер записи в байтах: заголовок и строки символа по биту на модуль"""
+    modules = symbol_size(version)
+    return RECORD_HEADER.size + modules * ((modules + 7) // 8)
+
+
+def pack_matrix(qr_matrix, border: int) -> bytes:
+    """
+    Упаковывает матрицу модулей в запись
+
+    Хранится только сам символ, по строкам, 8 модулей в байте. Уровень
+    коррекции и маска читаются из служебных модулей матрицы.
+
+    :param qr_matrix: Матрица из build_qr_matrix (с рамкой border)
+    :param border: Рамка матрицы в модулях
+    :return: Запись (RECORD_HEADER и упакованные строки)
+    """
+    modules = np.asarray(qr_matrix, dtype=bool)
+    size = len(modules) - 2 * border
+    if size < 21 or (size - 17) % 4:
+        raise ValueError(f"Некорректный размер символа QR: {size}")
+    symbol = modules[border:border + size, border:border + size]
+
+    error_correction, mask = read_format_info(qr_matrix, border)
+    header = RECORD_HEADER.pack((size - 17) // 4, error_correction, mask, border)
+    return header + np.packbits(symbol, axis=1).tobytes()
+
+
+def unpack_record(buffer, offset: int = 0) -> dict:
+    """
+    Читает запись из буфера (bytes, mmap)
+
+    :return: version, error_correction, mask, border и modules
+             (массив символа без рамки, bool)
+    """
+    version, error_correction, mask, border = RECORD_HEADER.unpack_from(buffer, offset)
+    size = symbol_size(version)
+    packed = np.frombuffer(buffer, dtype=np.uint8, count=record_size(version) - RECORD_HEADER.size,
+                           offset=offset + RECORD_HEADER.size)
+    modules = np.unpackbits(packed.reshape(size, -1), axis=1, count=size).astype(bool)
+    return {"version": version, "error_correction": error_correction, "mask": mask,
+            "border": border, "modules": modules}
+
+
+def to_qr_matrix(record: dict, border: Optional[int] = None) -> list:
+    """Восстанавливает матрицу с рамкой в формате build_qr_matrix"""
+    if border is None:
+        border = record["border"]
+    return np.pad(record["modules"], border).tolist()
+
+
+class MatrixWriter:
+    """
+    Пишет записи матриц в один файл, не держа их в памяти
+
+    Записи идут подряд, таблица смещений и таблица id дописываются в конец
+    при закрытии, а число записей и положение таблиц - в заголовок. Таблица id:
+    count + 1 смещений (u64) в следующие за ней строки UTF-8. Файл должен
+    поддерживать seek.
+    """
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        self._start = fp.tell()
+        self._offsets = []
+        self._ids = []
+        fp.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, 0, 0, 0, 0))
+
+    def __enter__(self) -> "MatrixWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write_record(self, record: bytes, item_id: Optional[str] = None) -> None:
+        """
+        Добавляет запись из pack_matrix
+
+        :param item_id: id задания (по умолчанию - номер записи с единицы)
+        """
+        self._offsets.append(self.fp.tell() - self._start)
+        self._ids.append(str(len(self._offsets) if item_id is None else item_id).encode("utf-8"))
+        self.fp.write(record)
+
+    def write_matrix(self, qr_matrix, border: int, item_id: Optional[str] = None) -> None:
+        """Упаковывает и добавляет матрицу"""
+        self.write_record(pack_matrix(qr_matrix, border), item_id)
+
+    def close(self) -> None:
+        """Дописывает таблицы смещений и id и заголовок"""
+        table_offset = self.fp.tell() - self._start
+        self.fp.write(np.asarray(self._offsets, dtype="<u8").tobytes())
+        ids_offset = self.fp.tell() - self._start
+        self.fp.write(np.cumsum([0] + [len(item_id) for item_id in self._ids], dtype="<u8").tobytes())
+        self.fp.write(b"".join(self._ids))
+        end = self.fp.tell()
+        self.fp.seek(self._start)
+        self.fp.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, 0, len(self._offsets),
+                                       table_offset, ids_offset))
+        self.fp.seek(end)
+
+
+class MatrixFile:
+    """
+    Читает файл матриц через mmap: записи не загружаются целиком
+
+    Поддерживает len(), индексацию и перебор; каждая запись - словарь
+    из unpack_record с добавленным id.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл отобразить нельзя
+            self._file.close()
+            raise ValueError(f"{path}: пустой файл")
+
+        try:
+            magic, fmt, _, count, table_offset, ids_offset = FILE_HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            self.close()
+            raise ValueError(f"{path}: файл слишком короткий")
+        if magic != FILE_MAGIC:
+            self.close()
+            raise ValueError(f"{path}: это не файл матриц QRForge")
+        if fmt != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path}: неподдерживаемая версия формата {fmt}")
+        self._offsets = np.frombuffer(self._map, dtype="<u8", count=count, offset=table_offset)
+        self._id_offsets = np.frombuffer(self._map, dtype="<u8", count=count + 1, offset=ids_offset)
+        self._ids_start = ids_offset + self._id_offsets.nbytes
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> dict:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        record = unpack_record(self._map, int(self._offsets[index]))
+        record["id"] = self.item_id(index)
+        return record
+
+    def item_id(self, index: int) -> str:
+        """id задания записи (без распаковки модулей)"""
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        start = self._ids_start + int(self._id_offsets[index])
+        end = self._ids_start + int(self._id_offsets[index + 1])
+        return self._map[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def __enter__(self) -> "MatrixFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Массивы смещений ссылаются на mmap, их нужно отпустить первыми
+        self._offsets = self._id_offsets = None
+        self._map.close()
+        self._file.close()
+
+
+def encode_item(item: dict) -> bytes:
+    """
+    Кодирует задание (из batch.prepare_items) в запись
+
+    Учитываются text, error_correction (None - подбор под логотип), border,
+    а для подбора уровня коррекции - logo_path и size.
+    """
+    border = item.get("border", 4)
+    error_correction = item.get("error_correction", ERROR_CORRECTION_LEVELS["H"])
+    if error_correction is None:
+        error_correction = select_error_correction(item["text"], item.get("logo_path"),
+                                                   item.get("size", 10), border)
+    return pack_matrix(build_qr_matrix(item["text"], error_correction, border), border)
+
+
+def export_matrices(items: Iterable[dict], path: str, workers: Optional[int] = None) -> int:
+    """
+    Кодирует задания в процессах и пишет их в один файл матриц
+
+    Записи идут в порядке items, с id заданий. Файл пишется через временный и заменяется
+    целиком, чтобы читатели не увидели его наполовину записанным.
+
+    :param items: Задания из batch.prepare_items
+    :param path: Путь к файлу матриц
+    :param workers: Число процессов (по умолчанию - число ядер)
+    :return: Число записей
+    """
+    items = list(items)
+    workers = workers or os.cpu_count() or 1
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f, MatrixWriter(f) as writer:
+        if workers == 1 or len(items) < 2:
+            for item, record in zip(items, map(encode_item, items)):
+                writer.write_record(record, item.get("id"))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Записи маленькие, поэтому отдаем воркерам крупные порции
+                chunksize = max(1, len(items) // (workers * 8))
+                for item, record in zip(items, executor.map(encode_item, items, chunksize=chunksize)):
+                    writer.write_record(record, item.get("id"))
+    os.replace(temp_path, path)
+    return len(items)
+
+
+def render_from_matrix(
+        record: Union[dict, bytes],
+        output_path: str = None,
+        logo_path: str = None,
+        color: str = "#000000",
+        bg_color: str = "#FFFFFF",
+        size: int = 10,
+        border: int = None,
+        style: str = "default",
+        gradient: Tuple[str, str] = None,
+        pattern: str = None,
+        corner_style: str = "square",
+        dot_style: str = "square",
+        memory_limit: int = None
+) -> Union[str, bytes]:
+    """
+    Рендерит QR-код из готовой матрицы (без повторного кодирования текста)
+
+    :param record: Запись из MatrixFile или bytes из pack_matrix
+    :param output_path: Путь для сохранения (если не указан - PNG возвращается как bytes)
+    :param border: Рамка в модулях (по умолчанию - из записи)
+    :param memory_limit: Лимит памяти в байтах, выше которого PNG рендерится полосами
+    :return: Путь к сохраненному файлу или PNG в виде bytes
+    """
+    # Импорт здесь, так как tiled сам использует функции generator
+    from tiled import should_tile, render_qr_tiled
+
+    if isinstance(record, (bytes, bytearray, memoryview)):
+        record = unpack_record(record)
+    if border is None:
+        border = record["border"]
+    qr_matrix = to_qr_matrix(record, border)
+    if isinstance(logo_path, str) and not os.path.exists(logo_path):
+        logo_path = None
+    params = dict(logo=logo_path, color=color, bg_color=bg_color, size=size, border=border, style=style,
+                  gradient=gradient, pattern=pattern, corner_style=corner_style, dot_style=dot_style)
+
+    buffer = io.BytesIO() if output_path is None else None
+    if output_path is None or output_path.lower().endswith(".png"):
+        if should_tile(qr_matrix, size, border, style, pattern, memory_limit):
+            if buffer is not None:
+                render_qr_tiled(qr_matrix, buffer, memory_limit=memory_limit, **params)
+                return buffer.getvalue()
+            with open(output_path, "wb") as f:
+                render_qr_tiled(qr_matrix, f, memory_limit=memory_limit, **params)
+            return output_path
+
+    img = render_qr(qr_matrix, **params)
+    if buffer is not None:
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+    img.save(output_path)
+    return output_path
+
+
+def render_matrix_file(path: str, output_dir: str = ".", threads: Optional[int] = None, **params) -> int:
+    """
+    Рендерит все записи файла матриц в PNG
+
+    Файлы называются по id заданий (<id>.png), как при --batch, так что
+    пропущенные при экспорте строки не сдвигают имена. Кодирование уже
+    выполнено, поэтому рендеринг идет в потоках (см. generator.render_many).
+
+    :param path: Файл матриц из export_matrices
+    :param output_dir: Каталог для результатов
+    :param threads: Число потоков (по умолчанию по числу ядер)
+    :param params: Параметры стиля render_from_matrix
+    :return: Число отрендеренных записей
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with MatrixFile(path) as matrices, ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as executor:
+        def render(index: int) -> str:
+            record = matrices[index]
+            output = output_path(output_dir, f"{record['id']}.png")
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            temp_path = f"{output}.{os.getpid()}.{index}.tmp.png"
+            render_from_matrix(record, temp_path, **params)
+            os.replace(temp_path, output)
+            return output
+
+        return sum(1 for _ in executor.map(render, range(len(matrices))))
@@ -0,0 +1,109 @@
+"""Набор воспроизводимых случаев рендеринга для эталонных тестов и замеров"""
+import os
+import random
+import zlib
+
+import numpy as np
+from PIL import Image
+from qrcode.constants import ERROR_CORRECT_H
+
+from generator import apply_style, build_qr_matrix, render_qr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGO = os.path.join(ROOT, "assets", "logos", "example_logo.png")
+
+TEXT = "QRForge"
+
+STYLES = ("default", "instagram", "telegram", "dark", "neon", "vintage",
+          "minimal", "abstract", "watercolor", "cyber", "pastel")
+CORNER_STYLES = ("square", "rounded", "circle", "pointed", "random")
+DOT_STYLES = ("square", "circle", "rounded", "diamond", "random")
+PATTERNS = (None, "dots", "watercolor", "cyber")
+
+# Пары (corner_style, dot_style), которые перебираются для каждого стиля
+SHAPE_PAIRS = (
+    ("square", "square"),
+    ("rounded", "circle"),
+    ("circle", "diamond"),
+    ("pointed", "rounded"),
+    ("random", "random"),
+)
+
+# Формы со сглаживанием ("random" выбирает в том числе их): растеризация краев
+# может меняться между версиями Pillow
+ANTIALIASED_SHAPES = {"circle", "rounded", "diamond", "random"}
+
+
+def build_cases() -> list:
+    """
+    Собирает матрицу случаев: style x (corner_style, dot_style) x pattern x logo
+
+    Полное произведение слишком велико, поэтому каждый стиль проходит все пары
+    форм, а паттерн и логотип чередуются так, что каждый стиль встречается
+    с каждым паттерном и с логотипом и без. Отдельно перебираются все
+    сочетания форм углов и точек в стиле default.
+    """
+    cases = {}
+
+    def add(style, corner_style, dot_style, pattern, logo):
+        case = {"style": style, "corner_style": corner_style, "dot_style": dot_style,
+                "pattern": pattern, "logo": logo}
+        cases[case_id(case)] = case
+
+    for i, style in enumerate(STYLES):
+        for j, (corner_style, dot_style) in enumerate(SHAPE_PAIRS):
+            add(style, corner_style, dot_style, PATTERNS[(i + j) % len(PATTERNS)], (i + j) % 2 == 0)
+    for corner_style in CORNER_STYLES:
+        for dot_style in DOT_STYLES:
+            add("default", corner_style, dot_style, None, False)
+    return list(cases.values())
+
+
+def case_id(case: dict) -> str:
+    """Имя случая, оно же имя файла эталона"""
+    return "-".join([
+        case["style"], case["corner_style"], case["dot_style"],
+        case["pattern"] or "plain", "logo" if case["logo"] else "nologo",
+    ])
+
+
+def effective_pattern(case: dict) -> str:
+    """Паттерн с учетом значения по умолчанию из стиля"""
+    return apply_style(case["style"], "#000000", "#FFFFFF", None, case["pattern"], "square", "square")[3]
+
+
+def is_antialiased(case: dict) -> bool:
+    """Есть ли в случае сглаженные формы или масштабированный логотип (LANCZOS)"""
+    return (
+        case["corner_style"] in ANTIALIASED_SHAPES
+        or case["dot_style"] in ANTIALIASED_SHAPES
+        or case["logo"]
+    )
+
+
+def seed_case(case: dict) -> None:
+    """Фиксирует random и numpy.random для случая"""
+    seed = zlib.crc32(case_id(case).encode())
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def case_matrix(border: int = 2) -> list:
+    """Матрица модулей, общая для всех случаев"""
+    return build_qr_matrix(TEXT, ERROR_CORRECT_H, border)
+
+
+def render_case(case: dict, size: int = 4, border: int = 2) -> Image.Image:
+    """Рендерит случай целиком с фиксированным seed"""
+    qr_matrix = case_matrix(border)
+    seed_case(case)
+    return render_qr(
+        qr_matrix,
+        logo=LOGO if case["logo"] else None,
+        size=size,
+        border=border,
+        style=case["style"],
+        pattern=case["pattern"],
+        corner_style=case["corner_style"],
+        dot_style=case["dot_style"],
+    )
@@ -0,0 +1,53 @@
+import pytest
+
+from content import build_payload, build_payloads, generate_vcard, generate_wifi_config
+
+
+def test_wifi_keeps_spaces_and_escapes_specials():
+    payload = generate_wifi_config("  my;net  ", "  pass word:1  ")
+    assert payload == r"WIFI:T:WPA;S:  my\;net  ;P:  pass word\:1  ;;"
+
+
+def test_blank_values_are_missing():
+    with pytest.raises(ValueError, match="пароль"):
+        generate_wifi_config("net", "   ")
+
+
+def test_vcard_escapes_text_fields():
+    vcard = generate_vcard("Doe; John", "+1 555 0100", org="A, B\nC")
+    assert r"FN:Doe\; John" in vcard
+    assert r"ORG:A\, B\nC" in vcard
+
+
+@pytest.mark.parametrize("field", ["url", "email", "phone"])
+def test_vcard_rejects_line_breaks_in_addresses(field):
+    fields = {"name": "John", "phone": "+15550100", "email": "j@example.com", "url": "http://x"}
+    fields[field] += "\nEND:VCARD"
+    with pytest.raises(ValueError):
+        build_payload("vcard", **fields)
+
+
+def test_geo_keeps_precision():
+    assert build_payload("geo", latitude="55.7558260", longitude="137.6172999") == "geo:55.755826,137.6172999"
+    assert build_payload("geo", latitude=0, longitude=-10) == "geo:0,-10"
+
+
+def test_build_payloads_collects_row_errors():
+    payloads, errors = build_payloads("sms", {"number": ["+100", "abc", ""], "message": ["hi", None, "x"]})
+    assert payloads == ["SMSTO:+100:hi", None, None]
+    assert [index for index, _ in errors] == [1, 2]
+
+
+def test_build_payloads_rejects_ragged_columns():
+    with pytest.raises(ValueError, match="разной длины"):
+        build_payloads("sms", {"number": ["+100", "+200"], "message": ["hi"]})
+
+
+def test_event_date_only_is_all_day():
+    payload = build_payload("event", summary="Отпуск", start="2026-01-01", end="2026-01-03")
+    assert "DTSTART;VALUE=DATE:20260101\nDTEND;VALUE=DATE:20260103" in payload
+
+    payload = build_payload("event", summary="Встреча", start="2026-01-01T10:00")
+    assert "DTSTART:20260101T100000" in payload
+    with pytest.raises(ValueError):
+        build_payload("event", summary="Встреча", start="2026-01-01", end="2026-01-01T11:00")
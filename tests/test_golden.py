@@ -0,0 +1,133 @@
+"""
+Сравнение рендеринга с эталонными изображениями
+
+Эталоны лежат в tests/golden. После намеренного изменения внешнего вида
+их нужно перегенерировать:
+    QRFORGE_UPDATE_GOLDEN=1 python -m pytest tests/test_golden.py
+"""
+import hashlib
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from cases import build_cases, case_id, case_matrix, effective_pattern, is_antialiased, render_case, seed_case, LOGO
+from generator import prepare_logo, render_qr
+from tiled import render_qr_tiled
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+UPDATE_GOLDEN = os.environ.get("QRFORGE_UPDATE_GOLDEN") == "1"
+
+# Эталоны совпадают попиксельно и с версиями из requirements.txt (Pillow 10.0.0,
+# qrcode 7.4.2), и с более новыми (Pillow 12.3.0, qrcode 8.2). Сравнение
+# попиксельное; только для сглаженных форм и масштабированного логотипа
+# (cases.is_antialiased) допускается до MAX_DIFF_PIXELS пикселей, у которых
+# какой-то канал изменился больше чем на PIXEL_DELTA. Это меньше одного модуля
+# (size * size = 16 пикселей в эталонах) и меньше смены размера логотипа
+PIXEL_DELTA = 32
+MAX_DIFF_PIXELS = 4
+
+CASES = build_cases()
+
+
+def pixel_hash(img: Image.Image) -> str:
+    """Хэш пикселей (не файла PNG, который зависит от кодировщика)"""
+    img = img.convert("RGB")
+    return hashlib.sha256(f"{img.size}".encode() + img.tobytes()).hexdigest()
+
+
+def diff_pixels(img: Image.Image, golden: Image.Image) -> int:
+    """Число пикселей, отличающихся больше чем на PIXEL_DELTA"""
+    diff = np.abs(np.asarray(img, dtype=np.int16) - np.asarray(golden, dtype=np.int16)).max(axis=2)
+    return int((diff > PIXEL_DELTA).sum())
+
+
+def assert_matches(case: dict, img: Image.Image, golden: Image.Image) -> None:
+    """Сравнивает рендеринг с эталоном: попиксельно или с допуском для is_antialiased"""
+    if pixel_hash(img) == pixel_hash(golden):
+        return
+    assert img.size == golden.size
+    assert is_antialiased(case), f"{case_id(case)}: изображение не совпадает с эталоном попиксельно"
+    count = diff_pixels(img, golden)
+    assert count <= MAX_DIFF_PIXELS, \
+        f"{case_id(case)}: отличается {count} пикселей, допустимо {MAX_DIFF_PIXELS}"
+
+
+@pytest.mark.parametrize("case", CASES, ids=case_id)
+def test_matches_golden(case):
+    img = render_case(case)
+    path = os.path.join(GOLDEN_DIR, case_id(case) + ".png")
+
+    if UPDATE_GOLDEN:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        img.save(path, optimize=True)
+        pytest.skip("эталон обновлен")
+    if not os.path.exists(path):
+        pytest.fail(f"Нет эталона {path}, запустите с QRFORGE_UPDATE_GOLDEN=1")
+
+    with Image.open(path) as golden:
+        assert_matches(case, img, golden.convert("RGB"))
+
+
+def test_tolerance_only_for_antialiased_cases():
+    square, smooth = (next(case for case in CASES if is_antialiased(case) == flag and not case["logo"])
+                      for flag in (False, True))
+    for case in (square, smooth):
+        img = render_case(case)
+        nudged = img.copy()
+        for x in range(MAX_DIFF_PIXELS):
+            nudged.putpixel((x, 0), (255, 0, 0))
+        if case is smooth:
+            assert_matches(case, nudged, img)
+        else:
+            with pytest.raises(AssertionError):
+                assert_matches(case, nudged, img)
+
+
+def test_tolerance_catches_single_module():
+    qr_matrix = case_matrix()
+    changed = [row[:] for row in qr_matrix]
+    changed[12][12] = not changed[12][12]
+
+    for shapes in (("square", "square"), ("circle", "circle")):
+        img = render_qr(qr_matrix, size=4, border=2, corner_style=shapes[0], dot_style=shapes[1])
+        other = render_qr(changed, size=4, border=2, corner_style=shapes[0], dot_style=shapes[1])
+        assert diff_pixels(img.convert("RGB"), other.convert("RGB")) > MAX_DIFF_PIXELS
+
+
+def test_tolerance_catches_smaller_logo():
+    base = render_qr(case_matrix(), size=4, border=2).convert("RGB")
+    images = []
+    for logo_size in (30, 28):
+        img = base.copy()
+        logo = prepare_logo(LOGO, img.size, logo_size)
+        img.paste(logo, ((img.width - logo.width) // 2,) * 2, logo)
+        images.append(img)
+    assert diff_pixels(*images) > MAX_DIFF_PIXELS
+
+
+# Шум паттерна watercolor в полосах генерируется по частям и не совпадает с целым
+TILED_CASES = [case for case in CASES if effective_pattern(case) != "watercolor"][::4]
+
+
+@pytest.mark.parametrize("case", TILED_CASES, ids=case_id)
+def test_tiled_matches_full(case):
+    full = render_case(case, size=6)
+
+    buffer = io.BytesIO()
+    seed_case(case)
+    render_qr_tiled(
+        case_matrix(), buffer,
+        logo=LOGO if case["logo"] else None,
+        size=6,
+        border=2,
+        style=case["style"],
+        pattern=case["pattern"],
+        corner_style=case["corner_style"],
+        dot_style=case["dot_style"],
+        memory_limit=1,
+    )
+    with Image.open(buffer) as tiled:
+        assert pixel_hash(tiled) == pixel_hash(full)
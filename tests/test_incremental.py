@@ -0,0 +1,65 @@
+import shutil
+
+from PIL import Image
+
+from batch import INDEX_NAME, load_index, prepare_items, render_incremental
+from cases import LOGO
+
+
+def run(tmp_path, rows, verify=False):
+    items, errors = prepare_items(rows, None, str(tmp_path))
+    assert not errors
+    return render_incremental(items, str(tmp_path / INDEX_NAME), workers=1, verify=verify)
+
+
+def test_add_change_delete(tmp_path):
+    report = run(tmp_path, [{"id": "a", "text": "one"}, {"id": "b", "text": "two"}])
+    assert (report["added"], report["rendered"]) == (2, 2)
+
+    report = run(tmp_path, [{"id": "a", "text": "one"}, {"id": "b", "text": "changed"}, {"id": "c", "text": "new"}])
+    assert (report["added"], report["changed"], report["unchanged"]) == (1, 1, 1)
+
+    report = run(tmp_path, [{"id": "a", "text": "one"}])
+    assert report["deleted"] == 2
+    assert not (tmp_path / "b.png").exists() and not (tmp_path / "c.png").exists()
+    assert set(load_index(str(tmp_path / INDEX_NAME))) == {"a"}
+
+
+def test_moved_output_removes_old_file(tmp_path):
+    run(tmp_path, [{"id": "a", "text": "one", "output": "a1.png"}])
+    report = run(tmp_path, [{"id": "a", "text": "one", "output": "a2.png"}])
+
+    assert report["changed"] == 1
+    assert (tmp_path / "a2.png").exists()
+    assert not (tmp_path / "a1.png").exists()
+
+
+def test_truncated_journal_tail(tmp_path):
+    run(tmp_path, [{"id": "a", "text": "one"}, {"id": "b", "text": "two"}])
+    index_path = tmp_path / INDEX_NAME
+    with open(index_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "b", "ha')
+
+    run(tmp_path, [{"id": "a", "text": "one"}])
+    assert not (tmp_path / "b.png").exists()
+    assert set(load_index(str(index_path))) == {"a"}
+
+
+def test_replaced_logo_rerenders(tmp_path):
+    logo = tmp_path / "logo.png"
+    shutil.copyfile(LOGO, logo)
+    rows = [{"id": "a", "text": "one", "logo_path": str(logo)}]
+    run(tmp_path, rows)
+
+    # Другой логотип под тем же именем
+    Image.new("RGB", (64, 64), "#ff0000").save(logo)
+    assert run(tmp_path, rows)["changed"] == 1
+
+
+def test_unverified_items_are_not_journaled(tmp_path):
+    rows = [{"id": "bad", "text": "hi", "style": "abstract", "size": 2}, {"id": "good", "text": "hi"}]
+    for unchanged in (0, 1):
+        report = run(tmp_path, rows, verify=True)
+        assert [item_id for item_id, _ in report["unverified"]] == ["bad"]
+        assert report["unchanged"] == unchanged
+    assert set(load_index(str(tmp_path / INDEX_NAME))) == {"good"}
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from cases import LOGO
+from generator import (
+    build_qr_matrix,
+    fit_logo_size,
+    prepare_logo,
+    render_qr,
+    select_error_correction,
+    ERROR_CORRECTION_LEVELS,
+    LOGO_SAFETY,
+)
+from verify import block_errors, codeword_layout, sample_modules
+
+
+def wrong_modules(img, qr_matrix, size: int, border: int) -> np.ndarray:
+    """Модули символа, которые читаются из изображения неверно"""
+    samples = sample_modules(img, len(qr_matrix), size, border)
+    symbol = (slice(border, len(qr_matrix) - border),) * 2
+    return (samples < 128)[symbol] != np.asarray(qr_matrix, dtype=bool)[symbol]
+
+
+@pytest.mark.parametrize("text, level, size", [
+    ("hi", "Q", 10), ("hi", "H", 10), ("https://example.com/perf", "H", 10),
+    ("x" * 50, "M", 7), ("x" * 120, "H", 6),
+])
+def test_logo_fits_every_block(text, level, size):
+    error_correction = ERROR_CORRECTION_LEVELS[level]
+    qr_matrix = build_qr_matrix(text, error_correction, 4)
+    capacity = codeword_layout((len(qr_matrix) - 25) // 4, error_correction)[2]
+
+    img = render_qr(qr_matrix, logo=LOGO, size=size, border=4)
+    errors = block_errors(wrong_modules(img, qr_matrix, size, 4), error_correction)
+    assert errors.any()
+    assert (errors <= LOGO_SAFETY * capacity).all(), (errors.tolist(), capacity.tolist())
+
+
+def test_logo_budget_is_per_block():
+    # Логотип 70 пикселей на v1-Q портит 8 кодовых слов, а блок исправляет 6
+    error_correction = ERROR_CORRECTION_LEVELS["Q"]
+    qr_matrix = build_qr_matrix("hi", error_correction, 4)
+    img = render_qr(qr_matrix, size=10, border=4)
+    logo = prepare_logo(LOGO, img.size, 70)
+    img.paste(logo, ((img.width - logo.width) // 2,) * 2, logo)
+    assert block_errors(wrong_modules(img, qr_matrix, 10, 4), error_correction).tolist() == [8]
+
+    assert fit_logo_size(qr_matrix, 10, 4, safety=1.0) < 70
+    assert fit_logo_size(qr_matrix, 10, 4) < fit_logo_size(qr_matrix, 10, 4, safety=1.0)
+
+
+def test_select_error_correction():
+    assert select_error_correction("hello") == ERROR_CORRECTION_LEVELS["L"]
+    assert select_error_correction("hello", "missing.png") == ERROR_CORRECTION_LEVELS["L"]
+    # Логотип в четверть кода не укладывается в половину коррекции ниже уровня H
+    assert select_error_correction("https://example.com/" + "x" * 200, LOGO) == ERROR_CORRECTION_LEVELS["H"]
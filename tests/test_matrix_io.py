@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pytest
+
+from batch import prepare_items
+from generator import build_qr_matrix, generate_qr_to_bytes, ERROR_CORRECTION_LEVELS
+from matrix_io import (
+    FILE_HEADER,
+    MatrixFile,
+    MatrixWriter,
+    export_matrices,
+    pack_matrix,
+    record_size,
+    render_from_matrix,
+    render_matrix_file,
+    to_qr_matrix,
+    unpack_record,
+)
+
+
+@pytest.mark.parametrize("level", sorted(ERROR_CORRECTION_LEVELS))
+@pytest.mark.parametrize("text, border", [("a", 0), ("https://example.com/" + "x" * 200, 4)])
+def test_pack_roundtrip(level, text, border):
+    qr_matrix = build_qr_matrix(text, ERROR_CORRECTION_LEVELS[level], border)
+    data = pack_matrix(qr_matrix, border)
+    record = unpack_record(data)
+
+    assert len(data) == record_size(record["version"])
+    assert record["error_correction"] == ERROR_CORRECTION_LEVELS[level]
+    assert record["border"] == border
+    assert 0 <= record["mask"] < 8
+    assert to_qr_matrix(record) == [[bool(module) for module in row] for row in qr_matrix]
+
+
+def test_matrix_file_is_indexable(tmp_path):
+    path = str(tmp_path / "codes.qrm")
+    items = [{"text": f"item-{index}", "border": 2} for index in range(5)]
+    assert export_matrices(items, path, workers=1) == 5
+
+    with MatrixFile(path) as matrices:
+        assert len(matrices) == 5
+        assert to_qr_matrix(matrices[-1]) == build_qr_matrix("item-4", border=2)
+        assert [record["version"] for record in matrices] == [1] * 5
+        assert [record["id"] for record in matrices] == ["1", "2", "3", "4", "5"]
+        with pytest.raises(IndexError):
+            matrices[5]
+
+
+def test_writer_fills_header_and_offsets():
+    buffer = io.BytesIO()
+    with MatrixWriter(buffer) as writer:
+        writer.write_matrix(build_qr_matrix("one"), 4)
+        writer.write_matrix(build_qr_matrix("two"), 4)
+
+    data = buffer.getvalue()
+    magic, _, _, count, table_offset, _ = FILE_HEADER.unpack_from(data)
+    offsets = np.frombuffer(data, dtype="<u8", count=count, offset=table_offset)
+    assert (magic, count) == (b"QRMX", 2)
+    assert to_qr_matrix(unpack_record(data, int(offsets[1]))) == build_qr_matrix("two")
+
+
+def test_matrix_file_rejects_other_files(tmp_path):
+    path = tmp_path / "codes.qrm"
+    path.write_bytes(b"not a matrix file at all")
+    with pytest.raises(ValueError):
+        MatrixFile(str(path))
+
+
+def test_render_from_matrix_matches_direct_render():
+    qr_matrix = build_qr_matrix("hello", ERROR_CORRECTION_LEVELS["H"], 4)
+    params = {"style": "instagram", "dot_style": "circle", "size": 6}
+    assert render_from_matrix(pack_matrix(qr_matrix, 4), **params) == generate_qr_to_bytes("hello", **params)
+
+    # Рамку можно поменять при рендеринге
+    png = render_from_matrix(unpack_record(pack_matrix(qr_matrix, 4)), border=1, size=6)
+    assert png == generate_qr_to_bytes("hello", border=1, size=6)
+
+
+def test_render_matrix_file_names_outputs_by_id(tmp_path):
+    rows = [{"id": "alpha", "text": "a"}, {"id": "beta", "text": ""}, {"id": "gamma", "text": "g"}]
+    items, errors = prepare_items(rows)
+    assert [item_id for item_id, _ in errors] == ["beta"]
+    path = str(tmp_path / "codes.qrm")
+    export_matrices(items, path, workers=1)
+
+    out = tmp_path / "out"
+    assert render_matrix_file(path, str(out), threads=2, size=3, border=1) == 2
+    assert sorted(p.name for p in out.iterdir()) == ["alpha.png", "gamma.png"]
+    assert (out / "gamma.png").read_bytes() == generate_qr_to_bytes("g", size=3, border=1)
@@ -0,0 +1,85 @@
+"""
+Бюджеты времени и памяти на рендеринг
+
+Время - лучшее из нескольких запусков. Память - прирост пикового RSS за один
+рендеринг в отдельном процессе: tracemalloc не видит буферы изображений PIL.
+На медленных машинах бюджет времени можно увеличить:
+    QRFORGE_PERF_SCALE=3 python -m pytest tests/test_performance.py
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from cases import LOGO
+from generator import generate_qr_to_bytes
+
+TIME_SCALE = float(os.environ.get("QRFORGE_PERF_SCALE", "1"))
+REPEATS = 3
+
+TEXT = "https://example.com/perf"
+
+# Рендеринг идет в дочернем процессе после импортов, прирост считается от пика
+# такого же процесса без рендеринга. Запуск через fork, а не сразу из pytest:
+# в Linux пик RSS наследуется через fork/exec, и большой процесс pytest скрыл бы замер
+RSS_SCRIPT = """
+import json, os, resource, sys
+from generator import generate_qr_to_bytes
+
+text, params = json.loads(sys.argv[1])
+
+def child_peak(render):
+    pid = os.fork()
+    if pid == 0:
+        if render:
+            generate_qr_to_bytes(text, **params)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+base = child_peak(False)
+# ru_maxrss в Linux в КБ, в macOS в байтах
+print((child_peak(True) - base) * (1 if sys.platform == "darwin" else 1024))
+"""
+
+# Имя -> (аргументы generate_qr_to_bytes, бюджет времени в секундах, бюджет памяти в МБ).
+# В память входит и первый вызов в процессе (ленивые импорты, кэш штампов)
+BUDGETS = {
+    "plain": ({"size": 10}, 0.10, 12),
+    "shapes-dots": ({"size": 10, "corner_style": "rounded", "dot_style": "circle", "pattern": "dots"}, 0.15, 14),
+    "gradient": ({"size": 10, "style": "instagram"}, 0.10, 12),
+    "neon-logo": ({"size": 10, "style": "neon", "logo_path": LOGO}, 0.30, 14),
+    "watercolor": ({"size": 10, "style": "watercolor"}, 0.80, 32),
+    # Полосы должны держать память около memory_limit: целиком это изображение занимает ~140 МБ
+    "tiled-print": ({"size": 100, "memory_limit": 16 * 1024 * 1024}, 2.0, 40),
+}
+
+
+def peak_rss_growth(params: dict) -> int:
+    """Прирост пикового RSS (байты) за один рендеринг в новом процессе"""
+    if not hasattr(os, "fork"):
+        pytest.skip("нужен os.fork")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", RSS_SCRIPT, json.dumps([TEXT, params])],
+                            cwd=root, capture_output=True, text=True, check=True).stdout
+    return int(output)
+
+
+@pytest.mark.parametrize("name", BUDGETS)
+def test_render_budget(name):
+    params, seconds, megabytes = BUDGETS[name]
+    generate_qr_to_bytes(TEXT, **params)  # прогрев: импорты и кэш штампов
+
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        generate_qr_to_bytes(TEXT, **params)
+        best = min(best, time.perf_counter() - start)
+
+    peak = peak_rss_growth(params)
+
+    assert best <= seconds * TIME_SCALE, f"{name}: {best:.3f} с, бюджет {seconds * TIME_SCALE:.3f} с"
+    assert peak <= megabytes * 1024 * 1024, f"{name}: {peak / 2 ** 20:.1f} МБ, бюджет {megabytes} МБ"
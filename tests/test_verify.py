@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from cases import LOGO
+from generator import build_qr_matrix, generate_qr, prepare_logo, render_qr, ERROR_CORRECTION_LEVELS
+from verify import codeword_layout, ModuleSampler, format_report, sample_modules, verify_qr
+
+
+def test_sampler_matches_whole_image():
+    qr_matrix = build_qr_matrix("hello", ERROR_CORRECTION_LEVELS["H"], 2)
+    img = render_qr(qr_matrix, size=9, border=2, style="instagram")
+    arr = np.asarray(img)
+
+    # Полосы произвольной высоты и в обратном порядке
+    sampler = ModuleSampler(len(qr_matrix), 9, 2)
+    for top in reversed(range(0, img.height, 23)):
+        sampler.add_rows(arr[top:top + 23], top)
+
+    expected = sample_modules(img, len(qr_matrix), 9, 2)
+    assert np.array_equal(sampler.samples(), expected)
+    assert np.array_equal(sample_modules(img, len(qr_matrix), 9, 2, band_height=1000), expected)
+
+
+def test_inverted_code_is_flagged():
+    qr_matrix = build_qr_matrix("hello", ERROR_CORRECTION_LEVELS["H"], 4)
+    img = render_qr(qr_matrix, size=6, color="#FFFFFF", bg_color="#000000")
+    report = verify_qr(img, qr_matrix, 6, 4, ERROR_CORRECTION_LEVELS["H"])
+
+    assert report["inverted"]
+    assert "инвертирован" in format_report(report)
+
+
+def test_blank_image_fails():
+    qr_matrix = build_qr_matrix("hello", ERROR_CORRECTION_LEVELS["H"], 4)
+    img = render_qr(qr_matrix, size=6)
+    blank = Image.new("RGB", img.size, "#FFFFFF")
+    blank.paste(img.crop((0, 0, img.width // 2, img.height)))
+    assert not verify_qr(blank, qr_matrix, 6, 4, ERROR_CORRECTION_LEVELS["H"])["passed"]
+
+
+def test_errors_are_counted_per_block():
+    # 23 ошибочных модуля из 441 - мало для всего символа, но это 8 кодовых слов
+    # одного блока v1-Q, который исправляет только 6
+    qr_matrix = build_qr_matrix("hi", ERROR_CORRECTION_LEVELS["Q"], 4)
+    img = render_qr(qr_matrix, size=10, border=4)
+    logo = prepare_logo(LOGO, img.size, 70)
+    img.paste(logo, ((img.width - logo.width) // 2,) * 2, logo)
+
+    report = verify_qr(img, qr_matrix, 10, 4, ERROR_CORRECTION_LEVELS["Q"])
+    assert (report["block_errors"], report["block_capacity"]) == (8, 6)
+    assert not report["passed"]
+    assert report["bit_error_rate"] < 0.1
+
+
+def test_codeword_layout_matches_qrcode_placement():
+    codewords, owners, capacity = codeword_layout(7, ERROR_CORRECTION_LEVELS["M"])
+    data_modules = np.count_nonzero(codewords >= 0)
+    assert data_modules == 8 * len(owners) == 8 * 196
+    assert np.bincount(codewords[codewords >= 0]).tolist() == [8] * 196
+    assert capacity.tolist() == [9, 9, 9, 9]
+    assert codeword_layout(1, ERROR_CORRECTION_LEVELS["H"])[2].tolist() == [8]
+
+
+@pytest.mark.parametrize("memory_limit", [None, 1])
+def test_sampling_during_render_matches_file(tmp_path, memory_limit):
+    qr_matrix = build_qr_matrix("hello", ERROR_CORRECTION_LEVELS["H"], 4)
+    sampler = ModuleSampler(len(qr_matrix), 7, 4)
+    path = generate_qr("hello", str(tmp_path / "qr.png"), size=7, style="instagram",
+                       memory_limit=memory_limit, on_rows=sampler.add_rows)
+
+    with Image.open(path) as img:
+        assert np.array_equal(sampler.samples(), sample_modules(img, len(qr_matrix), 7, 4))
@@ -0,0 +1,125 @@
+import io
+import json
+import os
+
+import watch
+from watch import poll_spool, process_spool_files, read_ndjson_batches, watch_directory, watch_stream
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_watch_directory_once_moves_inputs(tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    write(spool / "good.jsonl", '{"id": "a", "text": "hello"}\n{"id": "b", "text": "hello"}\n')
+    write(spool / "mixed.csv", "id,text\n1,foo\n2,\n")
+    write(spool / "broken.jsonl", "not json\n")
+    write(spool / "notes.txt", "не файл заданий")
+
+    total = watch_directory(str(spool), workers=1, once=True)
+
+    assert total["files"] == 3
+    assert total["failed_files"] == 2
+    assert (spool / "out" / "good" / "a.png").exists()
+    assert (spool / "out" / "good" / "b.png").exists()
+    assert (spool / "out" / "mixed" / "1.png").exists()
+    assert (spool / "processed" / "good.jsonl").exists()
+    assert (spool / "failed" / "mixed.csv").exists()
+    assert "mixed.csv:2" in (spool / "failed" / "mixed.csv.errors.txt").read_text(encoding="utf-8")
+    assert (spool / "failed" / "broken.jsonl").exists()
+    assert (spool / "notes.txt").exists()
+    assert not any(name.endswith(".tmp") for _, _, files in os.walk(spool) for name in files)
+
+
+def test_poll_spool_waits_until_file_is_stable(tmp_path):
+    write(tmp_path / "early.jsonl", '{"text": "a"}\n')
+    events = poll_spool(str(tmp_path), interval=0)
+
+    # Файлы, лежавшие при запуске, готовы сразу
+    assert next(events) == [str(tmp_path / "early.jsonl")]
+    os.remove(tmp_path / "early.jsonl")
+
+    # Новый файл выдается только после того, как он не менялся между опросами
+    write(tmp_path / "late.jsonl", '{"text": "b"}\n')
+    assert next(events) == [str(tmp_path / "late.jsonl")]
+
+
+def test_read_ndjson_batches_splits_and_flushes():
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(write_fd, "wb") as writer:
+        writer.write(b"".join(b'{"text": "%d"}\n' % i for i in range(5)) + b'{"text": "tail"}')
+    with os.fdopen(read_fd, "rb") as reader:
+        batches = list(read_ndjson_batches(reader, batch_size=2, wait=0.01))
+
+    assert [len(batch) for batch in batches] == [2, 2, 2]
+    assert batches[-1][-1] == b'{"text": "tail"}'
+
+
+def test_watch_stream_replies_per_line(tmp_path):
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(write_fd, "wb") as writer:
+        writer.write(b'{"id": "ok", "text": "hello"}\nbroken\n{"id": "empty", "text": ""}\n')
+    out = io.StringIO()
+    with os.fdopen(read_fd, "rb") as reader:
+        total = watch_stream(reader, str(tmp_path), workers=1, wait=0.01, out=out)
+
+    replies = {reply["id"]: reply for reply in map(json.loads, out.getvalue().splitlines())}
+    assert replies["ok"]["output"] == os.path.join(str(tmp_path), "ok.png")
+    assert (tmp_path / "ok.png").exists()
+    assert replies["2"]["error"]
+    assert replies["empty"]["error"] == "не указан text"
+    assert total["lines"] == 3 and total["rendered"] == 1 and len(total["errors"]) == 2
+
+
+def test_watch_rejects_output_outside_output_dir(tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    target = tmp_path / "escaped.png"
+    write(spool / "evil.jsonl",
+          json.dumps({"id": "up", "text": "hello", "output": "../../escaped.png"}) + "\n"
+          + json.dumps({"id": "abs", "text": "hello", "output": str(target)}) + "\n"
+          + json.dumps({"id": "ok", "text": "hello", "output": "nested/../ok.png"}) + "\n")
+
+    total = watch_directory(str(spool), workers=1, once=True)
+
+    assert total["failed_files"] == 1
+    assert not target.exists()
+    assert (spool / "out" / "ok.png").exists()
+    errors = (spool / "failed" / "evil.jsonl.errors.txt").read_text(encoding="utf-8")
+    assert "вне каталога результатов" in errors
+
+
+def test_watch_stream_reports_unverified(tmp_path):
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(write_fd, "wb") as writer:
+        writer.write(b'{"id": "a", "text": "hi", "style": "abstract", "size": 2}\n{"id": "b", "text": "hi"}\n')
+    out = io.StringIO()
+    with os.fdopen(read_fd, "rb") as reader:
+        total = watch_stream(reader, str(tmp_path), workers=1, wait=0.01, verify=True, out=out)
+
+    replies = {reply["id"]: reply for reply in map(json.loads, out.getvalue().splitlines())}
+    assert replies["a"]["output"] is None and replies["a"]["error"].startswith("НЕ ЧИТАЕТСЯ")
+    assert replies["b"]["error"] is None
+    assert [item_id for item_id, _ in total["errors"]] == ["a"]
+
+
+def test_vanished_spool_files_are_skipped(tmp_path, monkeypatch):
+    write(tmp_path / "good.jsonl", '{"id": "a", "text": "hello"}\n')
+    write(tmp_path / "taken.jsonl", '{"id": "b", "text": "hello"}\n')
+    render_batch = watch.render_batch
+
+    def take_file_then_render(*args, **kwargs):
+        # Другой демон забирает файл, пока этот рендерит
+        os.remove(tmp_path / "taken.jsonl")
+        return render_batch(*args, **kwargs)
+
+    monkeypatch.setattr(watch, "render_batch", take_file_then_render)
+    paths = [str(tmp_path / name) for name in ("missing.jsonl", "good.jsonl", "taken.jsonl")]
+    summary = process_spool_files(paths, None, str(tmp_path / "out"), workers=1)
+
+    assert (summary["files"], summary["failed_files"]) == (1, 0)
+    assert (tmp_path / "processed" / "good.jsonl").exists()
+    assert not (tmp_path / "processed" / "taken.jsonl").exists()
@@ -0,0 +1,213 @@
+import struct
+import zlib
+from typing import BinaryIO, Callable, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from generator import (
+    apply_style,
+    apply_pattern,
+    apply_effects,
+    choose_random_shapes,
+    draw_modules,
+    place_logo,
+    random_circles,
+)
+
+# Порог памяти, после которого QR-код рендерится полосами
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Минимальная высота полосы в пикселях
+MIN_BAND_HEIGHT = 64
+
+# Радиусы размытия, которые используют паттерны и эффекты стилей
+_PATTERN_BLUR = {"watercolor": 1}
+_STYLE_BLUR = {"watercolor": 1, "neon": 3}
+
+
+class PngStreamWriter:
+    """Пишет RGB-изображение в PNG построчно, не держа его целиком в памяти"""
+
+    def __init__(self, fp: BinaryIO, width: int, height: int, compress_level: int = 6):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+
+        fp.write(b"\x89PNG\r\n\x1a\n")
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, tag: bytes, data: bytes) -> None:
+        self.fp.write(struct.pack(">I", len(data)))
+        self.fp.write(tag)
+        self.fp.write(data)
+        self.fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF))
+
+    def _flush_idat(self, force: bool = False) -> None:
+        if self._pending and (force or self._pending_size >= 256 * 1024):
+            self._write_chunk(b"IDAT", b"".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Добавляет строки изображения (массив формы (h, width, 3), uint8)"""
+        height = rows.shape[0]
+        if rows.shape[1:] != (self.width, 3):
+            raise ValueError(f"Ожидались строки шириной {self.width} RGB, получено {rows.shape}")
+        if self.rows_written + height > self.height:
+            raise ValueError("Записано больше строк, чем указано в заголовке PNG")
+
+        # Каждая строка PNG начинается с байта фильтра (0 - без фильтра)
+        scanlines = np.zeros((height, self.width * 3 + 1), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(height, -1)
+
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        self.rows_written += height
+        self._flush_idat()
+
+    def close(self) -> None:
+        """Дописывает сжатые данные и конец файла"""
+        if self.rows_written != self.height:
+            raise ValueError(f"Записано {self.rows_written} строк из {self.height}")
+        self._pending.append(self._compressor.flush())
+        self._flush_idat(force=True)
+        self._write_chunk(b"IEND", b"")
+
+
+def estimate_render_memory(img_size: int, style: str, pattern: Optional[str]) -> int:
+    """Оценивает пиковую память обычного рендеринга в байтах"""
+    # Холст, его копия в ImageDraw/PNG-кодере и результат эффектов
+    copies = 3
+    if pattern == "watercolor":
+        # Массив numpy, шум int32 и размытая копия
+        copies += 7
+    elif pattern in ("dots", "cyber"):
+        copies += 2
+    if style in ("watercolor", "neon"):
+        # Размытая копия и результат смешивания
+        copies += 2
+    return img_size * img_size * 3 * copies
+
+
+def band_overlap(style: str, pattern: Optional[str]) -> int:
+    """Сколько строк нужно добавить к полосе сверху и снизу, чтобы размытие совпало с целым изображением"""
+    radii = [_PATTERN_BLUR.get(pattern, 0), _STYLE_BLUR.get(style, 0)]
+    return sum(3 * radius + 2 for radius in radii if radius)
+
+
+def should_tile(
+        qr_matrix,
+        size: int,
+        border: int,
+        style: str = "default",
+        pattern: str = None,
+        memory_limit: int = None
+) -> bool:
+    """Проверяет, превысит ли обычный рендеринг лимит памяти"""
+    if memory_limit is None:
+        memory_limit = DEFAULT_MEMORY_LIMIT
+    pattern = apply_style(style, "#000000", "#FFFFFF", None, pattern, "square", "square")[3]
+    img_size = len(qr_matrix) * size + 2 * border * size
+    return estimate_render_memory(img_size, style, pattern) > memory_limit
+
+
+def render_qr_tiled(
+        qr_matrix,
+        fp: BinaryIO,
+        logo=None,
+        color: str = "#000000",
+        bg_color: str = "#FFFFFF",
+        size: int = 10,
+        border: int = 4,
+        style: str = "default",
+        gradient: Tuple[str, str] = None,
+        pattern: str = None,
+        corner_style: str = "square",
+        dot_style: str = "square",
+        memory_limit: int = None,
+        on_rows: Callable[[np.ndarray, int], None] = None
+) -> None:
+    """
+    Рендерит QR-код горизонтальными полосами и сразу пишет их в PNG
+
+    Пиковая память пропорциональна высоте полосы, а не размеру изображения.
+    Полосы рендерятся с запасом строк сверху и снизу, чтобы размытие
+    на стыках совпадало с рендерингом целиком.
+
+    :param qr_matrix: Матрица модулей из build_qr_matrix
+    :param fp: Файл (или BytesIO), открытый на запись в бинарном режиме
+    :param logo: Путь к логотипу или уже загруженное изображение
+    :param memory_limit: Лимит памяти в байтах, по которому выбирается высота полосы
+    :param on_rows: Вызывается с каждой готовой полосой (массив (h, w, 3)) и номером ее первой строки,
+                    например, ModuleSampler.add_rows для проверки без повторного чтения файла
+    """
+    if memory_limit is None:
+        memory_limit = DEFAULT_MEMORY_LIMIT
+
+    color, bg_color, gradient, pattern, corner_style, dot_style = apply_style(
+        style, color, bg_color, gradient, pattern, corner_style, dot_style
+    )
+
+    matrix_size = len(qr_matrix)
+    img_size = matrix_size * size + 2 * border * size
+
+    # Все случайные решения принимаем заранее, чтобы полосы совпадали на стыках
+    random_shapes = None
+    if "random" in (corner_style, dot_style):
+        random_shapes = choose_random_shapes(qr_matrix, corner_style, dot_style)
+
+    prepared_logo, logo_pos, skip_modules = None, None, None
+    placement = place_logo(logo, qr_matrix, size, border) if logo is not None else None
+    if placement:
+        prepared_logo, logo_pos, skip_modules = placement
+    if pattern in _PATTERN_BLUR:
+        # Размытие паттерна растаскивает модули из-под логотипа за его край
+        skip_modules = None
+
+    circles = random_circles(img_size, img_size) if style == "abstract" else None
+
+    # Высота полосы из лимита памяти с учетом тех же копий, что и при обычном рендеринге
+    overlap = band_overlap(style, pattern)
+    bytes_per_row = estimate_render_memory(img_size, style, pattern) // img_size
+    band_height = max(MIN_BAND_HEIGHT, memory_limit // max(bytes_per_row, 1) - 2 * overlap)
+
+    writer = PngStreamWriter(fp, img_size, img_size)
+    for top in range(0, img_size, band_height):
+        bottom = min(top + band_height, img_size)
+        context_top = max(0, top - overlap)
+        context_bottom = min(img_size, bottom + overlap)
+
+        band = Image.new("RGB", (img_size, context_bottom - context_top), bg_color)
+
+        # Строки матрицы, модули которых задевают полосу (модуль занимает size + 1 пикселей)
+        first_row = max(0, (context_top - size) // size - border)
+        last_row = min(matrix_size, (context_bottom - 1) // size - border + 1)
+        draw_modules(
+            ImageDraw.Draw(band), qr_matrix, size, border, color, gradient,
+            corner_style, dot_style,
+            rows=range(first_row, max(first_row, last_row)),
+            offset_y=context_top,
+            random_shapes=random_shapes,
+            skip_modules=skip_modules
+        )
+        band = apply_pattern(band, pattern, color, offset_y=context_top)
+
+        if prepared_logo is not None:
+            band.paste(prepared_logo, (logo_pos[0], logo_pos[1] - context_top), prepared_logo)
+
+        band = apply_effects(band, style, offset_y=context_top, circles=circles)
+
+        rows = np.asarray(band)[top - context_top:bottom - context_top]
+        writer.write_rows(rows)
+        if on_rows:
+            on_rows(rows, top)
+        del band, rows
+
+    writer.close()
@@ -1,31 +1,37 @@
 import streamlit as st
-from generator import generate_qr_to_bytes
+from generator import build_qr_matrix, render_qr
 from encryptor import encrypt, save_key
-import os
+from content import generate_wifi_config, generate_vcard
+from PIL import Image
 from datetime import datetime
-import base64
+import io
 
+# Размер модуля для живого предпросмотра (полное разрешение - по кнопке)
+PREVIEW_SIZE = 4
 
-def generate_wifi_config(ssid: str, password: str, security: str = 'WPA') -> str:
-    """Генерирует строку конфигурации WiFi для QR-кода"""
-    return f"WIFI:T:{security};S:{ssid};P:{password};;"
 
+@st.cache_data(max_entries=256)
+def encode_matrix(text: str, border: int) -> list:
+    """Кэширует кодирование текста в матрицу модулей"""
+    return build_qr_matrix(text, border=border)
 
-def generate_vcard(name: str, phone: str, email: str = None, org: str = None) -> str:
-    """Генерирует vCard для QR-кода"""
-    vcard = f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nTEL:{phone}"
-    if email:
-        vcard += f"\nEMAIL:{email}"
-    if org:
-        vcard += f"\nORG:{org}"
-    vcard += "\nEND:VCARD"
-    return vcard
 
+@st.cache_resource(max_entries=32)
+def load_logo(logo_bytes: bytes) -> Image.Image:
+    """Кэширует декодирование загруженного логотипа (общий объект, не изменять)"""
+    logo = Image.open(io.BytesIO(logo_bytes))
+    logo.load()
+    return logo
 
-def get_image_download_link(img_bytes, filename):
-    """Генерирует ссылку для скачивания изображения"""
-    b64 = base64.b64encode(img_bytes).decode()
-    return f'<a href="data:image/png;base64,{b64}" download="{filename}">Скачать QR-код</a>'
+
+@st.cache_data(max_entries=128)
+def render_png(text: str, params: dict, logo_bytes: bytes = None) -> bytes:
+    """Кэширует итоговый PNG для набора параметров"""
+    logo = load_logo(logo_bytes) if logo_bytes else None
+    img = render_qr(encode_matrix(text, params["border"]), logo=logo, **params)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
 
 
 def main():
@@ -138,6 +144,7 @@ def main():
             key = st.text_input("Ключ шифрования (оставьте пустым для автоматической генерации)")
 
     # Основная форма
+    content_error = None
     with st.form("qr_form"):
         # Поля ввода в зависимости от типа контента
         if content_type == "Текст":
@@ -152,7 +159,10 @@ def main():
                 ssid = st.text_input("Название сети (SSID)")
             with col2:
                 password = st.text_input("Пароль", type="password")
-            content = generate_wifi_config(ssid, password)
+            try:
+                content = generate_wifi_config(ssid, password)
+            except ValueError as e:
+                content, content_error = None, str(e)
         elif content_type == "vCard":
             col1, col2 = st.columns(2)
             with col1:
@@ -161,7 +171,10 @@ def main():
             with col2:
                 email = st.text_input("Email")
                 org = st.text_input("Организация")
-            content = generate_vcard(name, phone, email, org)
+            try:
+                content = generate_vcard(name, phone, email, org)
+            except ValueError as e:
+                content, content_error = None, str(e)
 
         # Загрузка логотипа
         logo_file = st.file_uploader("Логотип (опционально)", type=["png", "jpg", "jpeg"])
@@ -169,13 +182,30 @@ def main():
         # Кнопка генерации
         submitted = st.form_submit_button("Сгенерировать QR-код")
 
-    # Обработка формы
-    if submitted:
-        if (content_type == "WiFi" and (not ssid or not password)) or \
-                (content_type == "vCard" and (not name or not phone)):
-            st.error("Заполните все обязательные поля")
-            return
+    params = {
+        "color": color,
+        "bg_color": bg_color,
+        "size": size,
+        "border": border,
+        "style": style_map[style],
+        "gradient": gradient,
+        "pattern": pattern_map[pattern],
+        "corner_style": corner_style_map[corner_style],
+        "dot_style": dot_style_map[dot_style]
+    }
+    logo_bytes = logo_file.getvalue() if logo_file else None
+    # Содержимое до шифрования и настройки шифрования: с ними сверяется готовый результат
+    source = {"content": content, "encrypt": encrypt_data, "key": key if encrypt_data else None}
 
+    if content_error:
+        if submitted:
+            st.error(f"Проверьте поля: {content_error}")
+        else:
+            st.info("Заполните обязательные поля, чтобы увидеть предпросмотр")
+        return
+
+    # Полное разрешение рендерим только по кнопке
+    if submitted:
         # Шифрование если нужно
         encryption_key = None
         if encrypt_data:
@@ -188,44 +218,41 @@ def main():
                 st.error(f"Ошибка шифрования: {str(e)}")
                 return
 
-        # Генерация QR-кода
         try:
-            logo_path = None
-            if logo_file:
-                # Сохраняем временный файл
-                logo_path = f"temp_logo.{logo_file.name.split('.')[-1]}"
-                with open(logo_path, "wb") as f:
-                    f.write(logo_file.getbuffer())
-
-            qr_img = generate_qr_to_bytes(
-                text=content,
-                logo_path=logo_path,
-                color=color,
-                bg_color=bg_color,
-                size=size,
-                border=border,
-                style=style_map[style],
-                gradient=gradient,
-                pattern=pattern_map[pattern],
-                corner_style=corner_style_map[corner_style],
-                dot_style=dot_style_map[dot_style]
-            )
-
-            # Удаляем временный файл логотипа если был
-            if logo_file and os.path.exists(logo_path):
-                os.remove(logo_path)
-
-            # Отображение результата
-            st.image(qr_img, caption="Ваш QR-код", use_column_width=True)
-
-            # Ссылка для скачивания
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"qr_{timestamp}.png"
-            st.markdown(get_image_download_link(qr_img, filename), unsafe_allow_html=True)
-
+            st.session_state["qr_result"] = {
+                "source": source,
+                "params": params,
+                "logo_bytes": logo_bytes,
+                "png": render_png(content, params, logo_bytes),
+                "filename": f"qr_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+            }
         except Exception as e:
             st.error(f"Ошибка генерации QR-кода: {str(e)}")
+            return
+
+    # Готовый результат показываем, пока содержимое и настройки не изменились
+    result = st.session_state.get("qr_result")
+    if result and result["source"] == source and result["params"] == params \
+            and result["logo_bytes"] == logo_bytes:
+        st.image(result["png"], caption="Ваш QR-код", use_column_width=True)
+        st.download_button(
+            "Скачать QR-код",
+            data=result["png"],
+            file_name=result["filename"],
+            mime="image/png"
+        )
+        return
 
+    # Живой предпросмотр в низком разрешении
+    try:
+        preview = render_png(content, dict(params, size=PREVIEW_SIZE), logo_bytes)
+    except Exception as e:
+        st.error(f"Ошибка генерации QR-кода: {str(e)}")
+        return
+    caption = "Предпросмотр"
+    if encrypt_data:
+        caption += " (без шифрования)"
+    st.image(preview, caption=caption)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,232 @@
+from functools import lru_cache
+from typing import Tuple, Union
+
+import numpy as np
+import qrcode
+from PIL import Image
+from qrcode.base import rs_blocks
+from qrcode.constants import ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q, ERROR_CORRECT_H
+
+# Какую часть бюджета коррекции разрешено израсходовать на искажения стиля
+DEFAULT_SAFETY = 0.5
+
+# Кодовые слова защиты от ложного декодирования в малых версиях (ISO/IEC 18004,
+# таблица 9): они входят в коррекцию, но ошибки не исправляют
+MISDECODE_RESERVE = {
+    (1, ERROR_CORRECT_L): 3, (1, ERROR_CORRECT_M): 2, (1, ERROR_CORRECT_Q): 1, (1, ERROR_CORRECT_H): 1,
+    (2, ERROR_CORRECT_L): 2, (3, ERROR_CORRECT_L): 1,
+}
+
+
+@lru_cache(maxsize=None)
+def codeword_layout(version: int, error_correction: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Раскладка кодовых слов по модулям символа (порядок размещения данных qrcode)
+
+    :param version: Версия QR 1-40
+    :param error_correction: Уровень коррекции ошибок
+    :return: (codewords, owners, capacity): номер кодового слова для каждого модуля
+             символа (-1 - служебный модуль или остаточный бит), блок Рида-Соломона
+             каждого кодового слова и число исправимых кодовых слов в каждом блоке
+    """
+    # Служебные узоры расставляет сам qrcode; map_data перехватываем, чтобы
+    # получить пустой символ, в котором свободны (None) только модули данных
+    qr = qrcode.QRCode(version=version, error_correction=error_correction)
+    blank = []
+    qr.map_data = lambda data, mask_pattern: blank.extend(qr.modules)
+    qr.data_cache = []
+    qr.makeImpl(False, 0)
+    free = np.array([[cell is None for cell in row] for row in blank])
+
+    blocks = rs_blocks(version, error_correction)
+    total = sum(block.total_count for block in blocks)
+
+    # Обход, как в QRCode.map_data: пары столбцов справа налево, змейкой
+    modules_count = len(free)
+    codewords = np.full(free.shape, -1, dtype=np.int32)
+    bit, upward = 0, True
+    for col in range(modules_count - 1, 0, -2):
+        if col <= 6:
+            col -= 1
+        for row in (range(modules_count - 1, -1, -1) if upward else range(modules_count)):
+            for c in (col, col - 1):
+                if free[row, c]:
+                    if bit // 8 < total:
+                        codewords[row, c] = bit // 8
+                    bit += 1
+        upward = not upward
+
+    # Кодовые слова блоков чередуются: сначала данные, затем коррекция
+    owners = []
+    for counts in ([block.data_count for block in blocks],
+                   [block.total_count - block.data_count for block in blocks]):
+        for index in range(max(counts)):
+            owners += [number for number, count in enumerate(counts) if index < count]
+
+    reserve = MISDECODE_RESERVE.get((version, error_correction), 0)
+    capacity = [(block.total_count - block.data_count - reserve) // 2 for block in blocks]
+    return codewords, np.asarray(owners), np.asarray(capacity)
+
+
+def block_errors(wrong: np.ndarray, error_correction: int) -> np.ndarray:
+    """
+    Считает испорченные кодовые слова в каждом блоке Рида-Соломона
+
+    :param wrong: Маска ошибочных модулей символа (без рамки)
+    :param error_correction: Уровень коррекции ошибок
+    :return: Число испорченных кодовых слов по блокам (см. codeword_layout)
+    """
+    codewords, owners, capacity = codeword_layout((len(wrong) - 17) // 4, error_correction)
+    bad = np.unique(codewords[wrong & (codewords >= 0)])
+    return np.bincount(owners[bad], minlength=len(capacity))
+
+
+class ModuleSampler:
+    """
+    Собирает яркость в центрах модулей по полосам изображения
+
+    Полосы можно подавать в любом порядке; в памяти держится только
+    текущая полоса, а не все изображение.
+    """
+
+    def __init__(self, matrix_size: int, size: int, border: int):
+        self.centers = (np.arange(matrix_size) + border) * size + size // 2
+        # Усредняем небольшое окно вокруг центра, как это делает сканер
+        self.offsets = np.arange(-(size // 6), size // 6 + 1)
+        self.sums = np.zeros((matrix_size, matrix_size), dtype=np.float64)
+
+    def add_rows(self, rows: Union[np.ndarray, Image.Image], top: int) -> None:
+        """
+        Добавляет полосу изображения
+
+        :param rows: Полоса (массив (h, w, 3) или изображение PIL)
+        :param top: Номер первой строки полосы в изображении
+        """
+        height = len(rows) if isinstance(rows, np.ndarray) else rows.height
+        window_rows = self.centers[:, None] + self.offsets[None, :]
+        inside = (window_rows >= top) & (window_rows < top + height)
+        if not inside.any():
+            return
+        module_rows = np.nonzero(inside)[0]
+        pixel_rows = window_rows[inside] - top
+        if isinstance(rows, Image.Image):
+            # Из изображения берем только строки с центрами модулей
+            first, last = int(pixel_rows.min()), int(pixel_rows.max()) + 1
+            rows = np.asarray(rows.crop((0, first, rows.width, last)).convert("RGB"))
+            pixel_rows = pixel_rows - first
+
+        # Яркость считаем только в окнах, по формуле Pillow для режима L
+        columns = (self.centers[:, None] + self.offsets[None, :]).ravel()
+        rgb = rows[pixel_rows][:, columns].astype(np.uint32)
+        luma = (rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + 0x8000) >> 16
+        values = luma.reshape(len(pixel_rows), len(self.centers), len(self.offsets)).sum(axis=2)
+        np.add.at(self.sums, module_rows, values.astype(np.float64))
+
+    def samples(self) -> np.ndarray:
+        """Средняя яркость центра каждого модуля"""
+        return (self.sums / len(self.offsets) ** 2).astype(np.float32)
+
+
+def sample_modules(img: Image.Image, matrix_size: int, size: int, border: int,
+                   band_height: int = 256) -> np.ndarray:
+    """
+    Считывает яркость в центрах модулей
+
+    Изображение обходится полосами, поэтому память не растет с его размером.
+
+    :param img: Отрендеренный QR-код
+    :param matrix_size: Размер матрицы модулей (вместе с рамкой)
+    :param size: Размер модуля в пикселях
+    :param border: Отступ изображения в модулях
+    :return: Массив (matrix_size, matrix_size) со средней яркостью центра каждого модуля
+    """
+    sampler = ModuleSampler(matrix_size, size, border)
+    for top in range(0, img.height, band_height):
+        sampler.add_rows(img.crop((0, top, img.width, min(img.height, top + band_height))), top)
+    return sampler.samples()
+
+
+def verify_qr(
+        img: Image.Image,
+        qr_matrix,
+        size: int,
+        border: int,
+        error_correction: int,
+        safety: float = DEFAULT_SAFETY
+) -> dict:
+    """
+    Проверяет, что отрендеренный QR-код читается, без внешнего декодера
+
+    Изображение бинаризуется по порогу между медианной яркостью темных и светлых
+    модулей, результат сравнивается с матрицей. Ошибочные модули переводятся
+    в испорченные кодовые слова, и в каждом блоке Рида-Соломона их должно быть
+    не больше safety от числа исправимых.
+
+    :param img: Отрендеренный QR-код
+    :param qr_matrix: Матрица модулей из build_qr_matrix (с рамкой border)
+    :param size: Размер модуля в пикселях
+    :param border: Размер границы (тот же, что при кодировании и рендеринге)
+    :param error_correction: Уровень коррекции ошибок
+    :param safety: Какая часть исправляющей способности блока допустима
+    :return: Отчет: modules, errors, bit_error_rate, block_errors и block_capacity (худший блок),
+             budget (допустимо кодовых слов в нем), finder_errors, inverted, passed
+    """
+    samples = sample_modules(img, len(qr_matrix), size, border)
+    return verify_samples(samples, qr_matrix, border, error_correction, safety)
+
+
+def verify_samples(
+        samples: np.ndarray,
+        qr_matrix,
+        border: int,
+        error_correction: int,
+        safety: float = DEFAULT_SAFETY
+) -> dict:
+    """Проверяет читаемость по яркости центров модулей (из sample_modules или ModuleSampler), см. verify_qr"""
+    expected = np.asarray(qr_matrix, dtype=bool)
+
+    # Сравниваем только сам символ, без тихой зоны
+    symbol = (slice(border, len(expected) - border),) * 2
+    expected = expected[symbol]
+    samples = samples[symbol]
+
+    dark_level = float(np.median(samples[expected]))
+    light_level = float(np.median(samples[~expected]))
+    threshold = (dark_level + light_level) / 2
+    inverted = dark_level > light_level
+    observed = samples > threshold if inverted else samples < threshold
+    errors = observed != expected
+
+    # Искатели (три угловых квадрата 7x7) сканер должен найти без коррекции
+    symbol_size = len(expected)
+    finder = np.zeros_like(expected)
+    finder[:7, :7] = finder[:7, -7:] = finder[-7:, :7] = True
+
+    # Декодер исправляет ошибки в каждом блоке отдельно, поэтому важен худший блок
+    capacity = codeword_layout((symbol_size - 17) // 4, error_correction)[2]
+    bad_codewords = block_errors(errors, error_correction)
+    worst = int(np.argmax(bad_codewords / capacity))
+    finder_errors = int(errors[finder].sum())
+    return {
+        "modules": symbol_size * symbol_size,
+        "errors": int(errors.sum()),
+        "bit_error_rate": float(errors.mean()),
+        "block_errors": int(bad_codewords[worst]),
+        "block_capacity": int(capacity[worst]),
+        "budget": safety * int(capacity[worst]),
+        "finder_errors": finder_errors,
+        "inverted": inverted,
+        "passed": bool((bad_codewords <= safety * capacity).all()) and finder_errors == 0,
+    }
+
+
+def format_report(report: dict) -> str:
+    """Форматирует отчет проверки для вывода в консоль"""
+    status = "OK" if report["passed"] else "НЕ ЧИТАЕТСЯ"
+    return (
+        f"{status}: в худшем блоке испорчено кодовых слов {report['block_errors']} "
+        f"из {report['block_capacity']} исправимых (допустимо {report['budget']:g}), "
+        f"ошибок {report['errors']} из {report['modules']} модулей ({report['bit_error_rate']:.1%}), "
+        f"в искателях {report['finder_errors']}"
+        + (", инвертирован: светлые модули на темном фоне читают не все сканеры" if report["inverted"] else "")
+    )
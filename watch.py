@@ -0,0 +1,365 @@
+import json
+import os
+import select
+import signal
+import sys
+import time
+from typing import BinaryIO, Callable, Iterator, List, Optional, TextIO, Tuple
+
+from batch import create_pool, load_manifest, prepare_items, render_batch
+from verify import format_report
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # inotify_simple необязателен, без него каталог опрашивается
+    INotify = None
+
+# Файлы заданий, которые забираются из каталога
+SPOOL_SUFFIXES = (".jsonl", ".csv")
+
+# Куда перекладываются обработанные и ошибочные файлы (внутри каталога)
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+
+# Сколько QR-кодов собирать в одну порцию рендеринга
+DEFAULT_BATCH_SIZE = 64
+
+
+class _Stop:
+    """Флаг остановки по SIGTERM/SIGINT: текущая порция дорабатывается до конца"""
+
+    def __init__(self):
+        self.requested = False
+
+    def __call__(self, signum, frame):
+        self.requested = True
+
+    def install(self) -> None:
+        signal.signal(signal.SIGTERM, self)
+        signal.signal(signal.SIGINT, self)
+
+
+def is_spool_file(name: str) -> bool:
+    """Подходит ли файл каталога как файл заданий (временные и скрытые пропускаются)"""
+    return not name.startswith(".") and name.lower().endswith(SPOOL_SUFFIXES)
+
+
+def scan_spool(directory: str) -> dict:
+    """Файлы заданий каталога: путь -> (размер, время изменения)"""
+    files = {}
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_spool_file(entry.name):
+            stat = entry.stat()
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def poll_spool(directory: str, interval: float = 1.0, stop: Callable[[], bool] = lambda: False) -> Iterator[List[str]]:
+    """
+    Опрашивает каталог и выдает списки готовых файлов заданий
+
+    Файл готов, если его размер и время изменения не поменялись с прошлого
+    опроса - так не забираются файлы, которые еще дописываются.
+    Файлы, лежавшие в каталоге при запуске, выдаются сразу.
+    """
+    seen = scan_spool(directory)
+    ready = sorted(seen, key=lambda path: seen[path][1])
+    while True:
+        if ready:
+            yield ready
+        if stop():
+            return
+        time.sleep(interval)
+        current = scan_spool(directory)
+        ready = sorted((path for path, state in current.items() if seen.get(path) == state),
+                       key=lambda path: current[path][1])
+        # Выданные файлы уже переложены, остальные ждут следующего опроса
+        seen = {path: state for path, state in current.items() if path not in ready}
+
+
+def inotify_spool(directory: str, interval: float = 1.0, stop: Callable[[], bool] = lambda: False) -> Iterator[List[str]]:
+    """
+    Ждет файлы заданий через inotify и выдает их списками
+
+    Готовыми считаются файлы, закрытые после записи или перемещенные в каталог.
+    Файлы, лежавшие в каталоге при запуске, выдаются сразу.
+    """
+    with INotify() as inotify:
+        inotify.add_watch(directory, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+        existing = scan_spool(directory)
+        if existing:
+            yield sorted(existing, key=lambda path: existing[path][1])
+        while not stop():
+            events = inotify.read(timeout=int(interval * 1000))
+            ready = []
+            for event in events:
+                path = os.path.join(directory, event.name)
+                if is_spool_file(event.name) and path not in ready and os.path.isfile(path):
+                    ready.append(path)
+            if ready:
+                yield ready
+
+
+def spool_events(directory: str, interval: float = 1.0, stop: Callable[[], bool] = lambda: False) -> Iterator[List[str]]:
+    """Готовые файлы заданий: через inotify, если он доступен, иначе опросом"""
+    if INotify is not None and sys.platform.startswith("linux"):
+        return inotify_spool(directory, interval, stop)
+    return poll_spool(directory, interval, stop)
+
+
+def load_spool_file(path: str, output_dir: str) -> Tuple[List[dict], List[Tuple[str, str]]]:
+    """
+    Читает файл заданий и готовит задания
+
+    Результаты по умолчанию кладутся в подкаталог с именем файла, а id заданий
+    получают префикс с именем файла, чтобы не пересекаться с другими файлами.
+
+    :return: (задания, ошибки (id, сообщение))
+    :raises FileNotFoundError: Если файла уже нет (его забрал другой процесс)
+    """
+    name = os.path.basename(path)
+    try:
+        rows = load_manifest(path)
+    except FileNotFoundError:
+        raise
+    except (OSError, ValueError) as e:
+        return [], [(name, f"ошибка чтения: {e}")]
+
+    stem = os.path.splitext(name)[0]
+    for row in rows:
+        row.setdefault("output", os.path.join(stem, f"{row['id']}.png"))
+    items, errors = prepare_items(rows, None, output_dir)
+    for item in items:
+        item["id"] = f"{name}:{item['id']}"
+    return items, [(f"{name}:{item_id}", error) for item_id, error in errors]
+
+
+def move_aside(path: str, failed: bool, errors: List[Tuple[str, str]] = None) -> str:
+    """
+    Перекладывает обработанный файл в processed/ или failed/
+
+    Рядом с ошибочным файлом пишется <имя>.errors.txt со списком ошибок.
+
+    :return: Новый путь файла или None, если файла уже нет
+    """
+    target_dir = os.path.join(os.path.dirname(path), FAILED_DIR if failed else PROCESSED_DIR)
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(path))
+    try:
+        os.replace(path, target)
+    except FileNotFoundError:
+        return None
+    if errors:
+        temp_path = f"{target}.errors.txt.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{item_id}: {error}\n" for item_id, error in errors)
+        os.replace(temp_path, f"{target}.errors.txt")
+    return target
+
+
+def process_spool_files(paths: List[str], executor, output_dir: str, workers: Optional[int] = None,
+                        verify: bool = False) -> dict:
+    """
+    Рендерит файлы заданий одной порцией и перекладывает их
+
+    Файл уходит в failed/, если его не удалось прочитать или хотя бы одно
+    его задание завершилось ошибкой (или не прошло проверку при verify).
+    Файлы, которые исчезли до обработки (их забрал другой демон или отозвал
+    источник), пропускаются и в отчет не попадают.
+
+    :return: Отчет: files, failed_files, rendered, linked, errors
+    """
+    loaded, items = [], []
+    for path in paths:
+        try:
+            file_items, file_errors = load_spool_file(path, output_dir)
+        except FileNotFoundError:
+            continue
+        loaded.append((path, {item["id"] for item in file_items}, file_errors))
+        items += file_items
+
+    report = render_batch(items, workers=workers, verify=verify, executor=executor) if items else None
+    failures = list(report["errors"]) if report else []
+    failures += [(item_id, format_report(verify_report))
+                 for item_id, verify_report in (report["unverified"] if report else [])]
+
+    summary = {"files": 0, "failed_files": 0, "rendered": 0, "linked": 0, "errors": []}
+    if report:
+        summary["rendered"], summary["linked"] = report["rendered"], report["linked"]
+    for path, ids, errors in loaded:
+        # Копии дубликатов приходят с id своих заданий, поэтому принадлежность файлу сохраняется
+        errors = errors + [(item_id, error) for item_id, error in failures if item_id in ids]
+        if move_aside(path, failed=bool(errors), errors=errors) is None:
+            continue
+        summary["files"] += 1
+        summary["failed_files"] += bool(errors)
+        summary["errors"] += errors
+    return summary
+
+
+def watch_directory(
+        directory: str,
+        output_dir: str = None,
+        workers: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        interval: float = 1.0,
+        verify: bool = False,
+        once: bool = False,
+        on_batch: Callable[[dict], None] = None
+) -> dict:
+    """
+    Рендерит файлы заданий (JSONL/CSV), появляющиеся в каталоге
+
+    Пул воркеров запускается один раз и живет все время работы. Готовые файлы
+    читаются по очереди и рендерятся порциями примерно по batch_size QR-кодов,
+    после чего перекладываются в processed/ или failed/.
+
+    :param directory: Каталог, в который складываются файлы заданий
+    :param output_dir: Каталог результатов (по умолчанию <directory>/out)
+    :param workers: Число процессов (по умолчанию - число ядер)
+    :param batch_size: Сколько QR-кодов собирать в одну порцию
+    :param interval: Период опроса каталога в секундах
+    :param verify: Проверять читаемость каждого QR-кода
+    :param once: Обработать то, что уже лежит в каталоге, и выйти
+    :param on_batch: Вызывается с отчетом каждой порции
+    :return: Суммарный отчет: files, failed_files, rendered, linked, errors
+    """
+    output_dir = output_dir or os.path.join(directory, "out")
+    total = {"files": 0, "failed_files": 0, "rendered": 0, "linked": 0, "errors": []}
+    stop = _Stop()
+    if not once:
+        stop.install()
+
+    with create_pool(workers) as executor:
+        events = poll_spool(directory, interval, lambda: True) if once else \
+            spool_events(directory, interval, lambda: stop.requested)
+        for ready in events:
+            group, count = [], 0
+            for index, path in enumerate(ready):
+                group.append(path)
+                count += _count_rows(path)
+                if count >= batch_size or index == len(ready) - 1:
+                    summary = process_spool_files(group, executor, output_dir, workers, verify)
+                    for key in total:
+                        total[key] += summary[key]
+                    if on_batch:
+                        on_batch(summary)
+                    group, count = [], 0
+                if stop.requested:
+                    return total
+    return total
+
+
+def _count_rows(path: str) -> int:
+    """Примерное число заданий в файле (по числу строк)"""
+    try:
+        with open(path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+    except OSError:
+        return 0
+
+
+def read_ndjson_batches(stream: BinaryIO, batch_size: int = DEFAULT_BATCH_SIZE, wait: float = 0.2,
+                        stop: Callable[[], bool] = lambda: False) -> Iterator[List[bytes]]:
+    """
+    Читает строки из потока и выдает их порциями
+
+    Порция отдается, когда набралось batch_size строк или новых данных
+    нет дольше wait секунд, так что одиночный запрос не ждет заполнения порции.
+    """
+    fd = stream.fileno()
+    buffer, pending = b"", []
+    while True:
+        readable, _, _ = select.select([fd], [], [], wait if pending else 1.0)
+        if readable:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            pending += [line for line in lines if line.strip()]
+            while len(pending) >= batch_size:
+                yield pending[:batch_size]
+                pending = pending[batch_size:]
+        elif pending:
+            yield pending
+            pending = []
+        elif stop():
+            return
+
+    if buffer.strip():
+        pending.append(buffer)
+    if pending:
+        yield pending
+
+
+def watch_stream(
+        stream: BinaryIO,
+        output_dir: str = ".",
+        workers: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        wait: float = 0.2,
+        verify: bool = False,
+        out: TextIO = None
+) -> dict:
+    """
+    Рендерит задания из потока JSON-строк (например, stdin)
+
+    Каждая строка - задание в формате строки манифеста JSONL. На каждое
+    задание в out пишется JSON-строка с результатом: id, output, error
+    (при verify непрошедшее проверку задание приходит с ошибкой).
+
+    :param stream: Бинарный поток с поддержкой fileno()
+    :param output_dir: Каталог результатов
+    :param wait: Сколько секунд ждать следующих строк, прежде чем рендерить неполную порцию
+    :return: Суммарный отчет: lines, rendered, linked, errors
+    """
+    out = out or sys.stdout
+    total = {"lines": 0, "rendered": 0, "linked": 0, "errors": []}
+    stop = _Stop()
+    stop.install()
+
+    def reply(item_id: str, output: Optional[str], error: Optional[str]) -> None:
+        out.write(json.dumps({"id": item_id, "output": output, "error": error}, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def on_result(result: dict) -> None:
+        error = result["error"]
+        if not error and result["verify"] and not result["verify"]["passed"]:
+            error = format_report(result["verify"])
+        reply(result["id"], None if error else result["output"], error)
+        for copy_id, copy_path in result["copies"]:
+            reply(copy_id, None if error else copy_path, error)
+
+    with create_pool(workers) as executor:
+        for lines in read_ndjson_batches(stream, batch_size, wait, lambda: stop.requested):
+            rows = []
+            for line in lines:
+                total["lines"] += 1
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError("строка должна быть JSON-объектом")
+                except ValueError as e:
+                    total["errors"].append((str(total["lines"]), str(e)))
+                    reply(str(total["lines"]), None, f"некорректный JSON: {e}")
+                    continue
+                row.setdefault("id", str(total["lines"]))
+                rows.append(row)
+
+            items, errors = prepare_items(rows, None, output_dir)
+            for item_id, error in errors:
+                reply(item_id, None, error)
+            report = render_batch(items, workers=workers, verify=verify, on_result=on_result,
+                                  executor=executor) if items else None
+
+            total["errors"] += errors
+            if report:
+                total["rendered"] += report["rendered"]
+                total["linked"] += report["linked"]
+                total["errors"] += report["errors"]
+                total["errors"] += [(item_id, format_report(verify_report))
+                                    for item_id, verify_report in report["unverified"]]
+            if stop.requested:
+                break
+    return total